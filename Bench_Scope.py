@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+
+# ===============================================
+# Benchmark for S_Scope_ABE.py
+#
+# Runs the whole scope, A/D reader processes and all, on the simulated ADC board in
+# Sim_Hardware.py and reports for each renderer, X scale and A/D resolution:
+#   readings acquired by the A/D readers and readings drawn on the trace
+#   readings lost to ring overruns
+#   time from a reading's time stamp to it being put on the screen (mean, 95% and worst)
+#   screen updates per second
+#   canvas calls (PhotoImage calls with the raster renderer), GUI CPU time and A/D reader CPU
+#   time per sweep
+#   time taken by New_Trace to blank the last trace
+#
+# With no display (or with --headless) the Tk widgets are replaced by do-nothing stand-ins, so
+# what is measured is the scope's own work. Canvas calls are still counted. With a display,
+# --tk draws on a real window.
+#
+# Usage: python3 Bench_Scope.py [--headless|--tk] [--sweeps N] [--scales 0.5,1,2,3,4]
+#                               [--res 12,14,16,18] [--chans 1,3,5] [--parallel] [--stream]
+#                               [--render canvas,raster] [--fps N]
+# ================================================
+
+import os
+import sys
+import time
+import types
+import select
+import argparse
+
+os.environ["SCOPE_SIM"]="1"
+
+Parser=argparse.ArgumentParser(description="Benchmark the scope on the simulated ADC board")
+Parser.add_argument("--headless",action="store_true",help="don't use a display even if there is one")
+Parser.add_argument("--tk",action="store_true",help="draw on a real Tk window")
+Parser.add_argument("--sweeps",type=int,default=2,help="sweeps to time for each setting")
+Parser.add_argument("--scales",default="0.5,1,2,3,4",help="X scales (seconds) to run")
+Parser.add_argument("--res",default="12,14,16,18",help="A/D resolutions (bits) to run")
+Parser.add_argument("--chans",default="1",help="A/D channels to scan. The first is scope channel A")
+Parser.add_argument("--parallel",action="store_true",help="one A/D reader per converter chip")
+Parser.add_argument("--stream",action="store_true",help="continuous conversion (streaming) mode")
+Parser.add_argument("--render",default="canvas,raster",help="trace renderers to run, canvas and/or raster")
+Parser.add_argument("--fps",type=float,help="screen update rate, in place of the scope's own")
+Args=Parser.parse_args()
+
+Use_Tk=Args.tk and not Args.headless and os.environ.get("DISPLAY")
+
+# ---------------- Headless Tk ----------------
+
+# Widgets that take any call and do nothing. after() and createfilehandler() are remembered so
+# Run_For can drive the scope's callbacks the way mainloop would.
+Bench_After=[] # [due time, callback, args]
+Bench_Files={} # fd: callback
+
+class Bench_Tcl:
+    def createfilehandler(self,Fd,Mask,Callback):
+        Bench_Files[Fd]=Callback
+
+    def deletefilehandler(self,Fd):
+        Bench_Files.pop(Fd,None)
+
+    def call(self,*Args):
+        return ""
+
+class Bench_Widget:
+    Next_Id=0
+
+    def __init__(self,*Args,**Kw):
+        self.tk=Bench_Tk_App
+        self.master=Args[0] if Args else None
+
+    def __getattr__(self,Name):
+        if Name.startswith("__"):
+            raise AttributeError(Name)
+        def Any_Call(*Args,**Kw):
+            Bench_Widget.Next_Id += 1
+            return Bench_Widget.Next_Id
+        return Any_Call
+
+    def after(self,Ms,Callback=None,*Args):
+        Bench_After.append([time.time()+Ms/1000.0,Callback,Args])
+        return "after#%d" % len(Bench_After)
+
+class Bench_Var:
+    def __init__(self,master=None,value=0,name=None):
+        self.Value=value
+
+    def get(self):
+        return self.Value
+
+    def set(self,Value):
+        self.Value=Value
+
+def Headless_Tk():
+    Tk_Mod=types.ModuleType("tkinter")
+    for Name in ("Tk","Toplevel","Frame","LabelFrame","Canvas","Label","Button","Radiobutton",
+                 "Checkbutton","Entry","Scale","Scrollbar","PhotoImage","Message","Spinbox","Listbox"):
+        setattr(Tk_Mod,Name,type(Name,(Bench_Widget,),{}))
+    for Name in ("IntVar","DoubleVar","StringVar","BooleanVar"):
+        setattr(Tk_Mod,Name,type(Name,(Bench_Var,),{}))
+    for Name in ("N","S","E","W","NE","NW","SE","SW","CENTER","LEFT","RIGHT","TOP","BOTTOM","END",
+                 "ACTIVE","DISABLED","NORMAL","RAISED","SUNKEN","GROOVE","RIDGE","FLAT","HORIZONTAL",
+                 "VERTICAL","BOTH","X","Y","NONE","ALL"):
+        setattr(Tk_Mod,Name,Name.lower())
+    Tk_Mod.READABLE=2
+    Tk_Mod.WRITABLE=4
+    Tk_Mod.TclError=type("TclError",(Exception,),{})
+    Msg_Mod=types.ModuleType("tkinter.messagebox")
+    for Name in ("showinfo","showwarning","showerror","askyesno","askokcancel"):
+        setattr(Msg_Mod,Name,lambda *Args,**Kw: None)
+    Tk_Mod.messagebox=Msg_Mod
+    File_Mod=types.ModuleType("tkinter.filedialog")
+    for Name in ("askopenfilename","asksaveasfilename","askdirectory"):
+        setattr(File_Mod,Name,lambda *Args,**Kw: "")
+    Tk_Mod.filedialog=File_Mod
+    sys.modules["tkinter"]=Tk_Mod
+    sys.modules["tkinter.messagebox"]=Msg_Mod
+    sys.modules["tkinter.filedialog"]=File_Mod
+
+Bench_Tk_App=Bench_Tcl()
+if not Use_Tk:
+    Headless_Tk()
+
+sys.argv=[sys.argv[0],"--sim"] # Leave the scope with no options of ours to trip over
+import S_Scope_ABE as Scope
+from tkinter import Tk, IntVar
+
+# ---------------- Measuring ----------------
+
+Canvas_Calls=("create_line","create_rectangle","create_text","create_image","coords","delete",
+              "itemconfig","itemconfigure","move","scan_dragto")
+Image_Calls=("put","configure","blank")
+
+class Bench_Counts:
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.Canvas=0 # Canvas calls made by the trace
+        self.Drawn=0 # Readings put on the trace
+        self.Shows=0 # Screen updates
+        self.Sweeps=0 # New traces started
+        self.Blank_Time=0.0 # Time spent in New_Trace
+        self.Pending=[] # Time stamps of readings added but not yet shown
+        self.Latency=[] # Time stamp to screen, seconds
+
+Counts=Bench_Counts()
+
+# Wrap the trace's methods on the instance so every call is counted on its way through
+def Watch_Trace(Graph):
+    for Name in Canvas_Calls:
+        Call=getattr(Graph.Screen,Name)
+        def Count_Call(*Args,Call=Call,**Kw):
+            Counts.Canvas += 1
+            return Call(*Args,**Kw)
+        setattr(Graph.Screen,Name,Count_Call)
+
+    Add_Readings=Graph.Add_Readings
+    def Count_Add(Chan,Times,Volts):
+        LastLine,Used=Add_Readings(Chan,Times,Volts)
+        Counts.Drawn += Used
+        Counts.Pending.extend(Times[:Used])
+        return LastLine,Used
+    Graph.Add_Readings=Count_Add
+
+    Show_Trace=Graph.Show_Trace
+    def Count_Show():
+        Show_Trace()
+        Now=time.time()
+        Counts.Shows += 1
+        Counts.Latency.extend(Now-T for T in Counts.Pending)
+        Counts.Pending=[]
+    Graph.Show_Trace=Count_Show
+
+    New_Trace=Graph.New_Trace
+    def Count_New():
+        Start=time.perf_counter()
+        New_Trace()
+        Counts.Blank_Time += time.perf_counter()-Start
+        Counts.Sweeps += 1
+    Graph.New_Trace=Count_New
+
+# Count the raster renderer's PhotoImage calls with the canvas calls
+def Watch_Raster(Graph):
+    if Graph.Raster is None:
+        return
+    for Name in Image_Calls:
+        Call=getattr(Graph.Raster.Image,Name)
+        def Count_Call(*Args,Call=Call,**Kw):
+            Counts.Canvas += 1
+            return Call(*Args,**Kw)
+        setattr(Graph.Raster.Image,Name,Count_Call)
+
+# CPU seconds used so far by a reader process, or None where /proc can't tell us
+def Reader_CPU(Proc):
+    try:
+        with open("/proc/%d/stat" % Proc.pid) as Stat:
+            Fields=Stat.read().rsplit(")",1)[1].split()
+        return (int(Fields[11])+int(Fields[12]))/os.sysconf("SC_CLK_TCK")
+    except (OSError,ValueError,IndexError):
+        return None
+
+# ---------------- Running ----------------
+
+def Run_For(Root,Seconds):
+    if Use_Tk:
+        Root.after(int(Seconds*1000),Root.quit)
+        Root.mainloop()
+        return
+    End=time.time()+Seconds
+    while time.time() < End:
+        Now=time.time()
+        Due=[Entry for Entry in Bench_After if Entry[0] <= Now]
+        for Entry in Due:
+            Bench_After.remove(Entry)
+            Entry[1](*Entry[2])
+        Next=min([Entry[0] for Entry in Bench_After]+[End])
+        Ready,_,_=select.select(list(Bench_Files),[],[],max(0.0,Next-time.time()))
+        for Fd in Ready:
+            Bench_Files[Fd](Fd,2)
+
+X_Scale_Cmds={0.5:"XScale_HALF",1.0:"XScale_ONE",2.0:"XScale_TWO",3.0:"XScale_THREE",4.0:"XScale_FOUR"}
+
+def Percentile(Values,Pct):
+    if not Values:
+        return 0.0
+    Values=sorted(Values)
+    return Values[min(len(Values)-1,int(len(Values)*Pct/100.0))]
+
+def Bench():
+    Chans=[int(Chan) for Chan in Args.chans.split(",")]
+    Procs=[]
+    for Chip in (1,2):
+        Proc=Scope.Process(target=Scope.ADC_Reader_A,args=(Chip,Scope.Scope_Ctl_A,Scope.Scope_Ctl_Cond,
+                                                           Scope.Sample_Rings[Chip-1],Scope.Wake_Write_A))
+        Proc.daemon=True
+        Proc.start()
+        Procs.append(Proc)
+
+    if Args.fps:
+        Scope.Frame_Rate=Args.fps
+    Root=Tk()
+    for Name in ("Sel_Chan","ThreshA_On_Off","SweepSelectA","XScaleSelect","Trigger_Select",
+                 "Config_Select","Dir_Select","Res_Select"):
+        setattr(Scope,Name,IntVar())
+    App=Scope.App(Root)
+    Watch_Trace(App.TraceGraph)
+
+    Chan_Set=(Scope.ctypes.c_int*9)()
+    for Chan in Chans[1:]:
+        Chan_Set[Chan]=1
+    Scope.Control_Set(Chan=Chans[0],Chan_Set=Chan_Set,Parallel=int(Args.parallel),
+                      Stream=int(Args.stream))
+    App.PowOnOff.PowerOnOff()
+
+    print("Channels %s%s%s, %d sweeps per setting, %s" %
+          (Args.chans," parallel" if Args.parallel else ""," streaming" if Args.stream else "",
+           Args.sweeps,"Tk window" if Use_Tk else "headless"))
+    print("%6s %5s %4s %8s %7s %6s %5s %7s %7s %7s %6s %6s %8s %9s %9s %8s" %
+          ("Render","Scale","Bits","Acquired","Drawn","Lost","Ovr","Lat ms","p95 ms","Max ms","FPS",
+           "Sweeps","Calls/sw","GUI ms/sw","A/D ms/sw","Blank ms"))
+    for Render in Args.render.split(","):
+        App.TraceGraph.Set_Render(Render)
+        Watch_Raster(App.TraceGraph)
+        for Bits in [int(Res) for Res in Args.res.split(",")]:
+            Scope.AD_Res=Bits
+            Scope.Control_Set(Bits=Bits,Set=Scope.Scope_Ctl_A.Set+1)
+            for X_Scale in [float(Scale) for Scale in Args.scales.split(",")]:
+                getattr(App.XScaleGraph,X_Scale_Cmds[X_Scale])()
+                Run_For(Root,0.3) # Let the new settings take hold and the first trace start
+
+                Counts.Reset()
+                Heads=[Ring.Head.value for Ring in Scope.Sample_Rings]
+                Overruns=[Ring.Overrun.value for Ring in Scope.Sample_Rings]
+                GUI_CPU=time.process_time()
+                AD_Start=[Reader_CPU(Proc) for Proc in Procs]
+                Start=time.time()
+
+                Run_For(Root,Args.sweeps*X_Scale)
+
+                Elapsed=time.time()-Start
+                GUI_CPU=time.process_time()-GUI_CPU
+                Sweeps=max(Elapsed/X_Scale,1.0)
+                AD_End=[Reader_CPU(Proc) for Proc in Procs]
+                if None in AD_Start or None in AD_End:
+                    AD_Per_Sweep="-"
+                else:
+                    AD_Per_Sweep="%.2f" % (1000.0*(sum(AD_End)-sum(AD_Start))/Sweeps)
+                Acquired=sum(Ring.Head.value for Ring in Scope.Sample_Rings)-sum(Heads)
+                Overrun=sum(Ring.Overrun.value for Ring in Scope.Sample_Rings)-sum(Overruns)
+                Latency=[1000.0*T for T in Counts.Latency]
+                print("%6s %5.1f %4d %8d %7d %6d %5d %7.1f %7.1f %7.1f %6.1f %6d %8.0f %9.2f %9s %8.3f" %
+                      (Render,X_Scale,Bits,Acquired,Counts.Drawn,max(Acquired-Counts.Drawn,0),Overrun,
+                       sum(Latency)/len(Latency) if Latency else 0.0,Percentile(Latency,95),
+                       max(Latency) if Latency else 0.0,Counts.Shows/Elapsed,Counts.Sweeps,
+                       Counts.Canvas/Sweeps,1000.0*GUI_CPU/Sweeps,AD_Per_Sweep,
+                       1000.0*Counts.Blank_Time/max(Counts.Sweeps,1)))
+    App.PowOnOff.PowerOnOff()
+
+if __name__ == '__main__':
+    Bench()
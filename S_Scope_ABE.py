@@ -36,28 +36,81 @@
 # Pin 25: GND
 # Pin 26: GPIO 07 (SPI bus chip select)
 
-# Bring in the Raspberry Pi's General Purpose IO (GPIO) library
-import RPi.GPIO as GPIO
-
 # Bring in the time functions library
 from datetime import *
 import time
 
+# Bring in the compact array library. It is used when NumPy isn't available.
+from array import array
+
 # Bring in multi processing library
 import multiprocessing
-from multiprocessing import Process, Value, Array
+from multiprocessing import Process, RawArray, RawValue
 
 # Bring the graphic window library
 from tkinter import *
 from tkinter import messagebox
-
-# Bring in the AB Electronics code for the i2c interface to their ADC.
-# I had to copy these files into the directory this script is in
-# because I couldn't get the ABE suggested PATH to work for python3.
-from ABE_ADCPi import ADCPi
-from ABE_helpers import ABEHelpers
-
-import os # In case we need it later
+from tkinter import filedialog
+
+import os
+import sys
+import fcntl
+import ctypes
+import signal
+import cProfile
+import collections
+import struct
+import queue
+import threading
+import mmap
+import math
+
+# Started with --sim (or with SCOPE_SIM=1 in the environment) the scope runs on the simulated
+# GPIO pins and ADC board in Sim_Hardware.py instead of the real ones. Everything else runs just
+# the same, so it can be tried out and timed on any machine.
+Sim_Mode = "--sim" in sys.argv or os.environ.get("SCOPE_SIM","0") not in ("","0")
+
+# Value of a --Name=value command line option or, if it isn't given, of environment variable Env
+def Option(Name,Env,Default=None):
+    for Arg in sys.argv[1:]:
+        if Arg.startswith(Name+"="):
+            return Arg.split("=",1)[1]
+    return os.environ.get(Env,Default)
+
+# A number option, as Option. If it isn't a number from Low to High a warning is printed and
+# Default is used.
+def Number_Option(Name,Env,Default,Low,High):
+    Value=Option(Name,Env)
+    if Value is None:
+        return Default
+    try:
+        Number=float(Value)
+    except ValueError:
+        Number=None
+    if Number is None or not Low <= Number <= High:
+        sys.stderr.write("%s (%s) of %s is not a number from %g to %g. Using %g.\n" %
+                         (Name,Env,Value,Low,High,Default))
+        return Default
+    return Number
+
+if Sim_Mode:
+    from Sim_Hardware import GPIO, ADCPi, ABEHelpers, Sim_I2C_Dev
+else:
+    # Bring in the Raspberry Pi's General Purpose IO (GPIO) library
+    import RPi.GPIO as GPIO
+
+    # Bring in the AB Electronics code for the i2c interface to their ADC.
+    # I had to copy these files into the directory this script is in
+    # because I couldn't get the ABE suggested PATH to work for python3.
+    from ABE_ADCPi import ADCPi
+    from ABE_helpers import ABEHelpers
+
+# NumPy is optional. With it, batches of readings are converted to pixels in one vectorized
+# pass. Without it, the same conversion is done by a plain loop into arrays.
+try:
+    import numpy
+except ImportError:
+    numpy=None
 
 # Initialise the ADC device using i2c addresses 0x6a and 0x6b making
 # channels 1-4 at ox6a and channels 5-8 at 0x6b.
@@ -89,35 +142,923 @@ AD_Mod=0 # Later this will be a Toplevel window, but declared here to be a globa
 # Set up shared memory for the A/D converter module which will run as a concurrent task
 # Using the "_A" in the variable name here denotes AD channel x will be traced by scope channel "A".
 # If more scope channels are added in the future, they will be "_B"... etc.
-ADchannel_A = Value('i',0) # Channel AD converter is to read
-ADvalue_A = Value('f',0.0) # Volts returned from ADC
-ReadTime_A = Value('d',0.0) # This value can be quite large, so use a double float
-AD_Bits_A = Value('i',0) # Bits of ADC resolution passed to converter module
-AD_Adrs1_A = Value('i',0) # i2c address of ADC channels 1-4
-AD_Adrs2_A = Value('i',0) # i2c address of ADC channels 5-8
-AD_Set_A = Value('i',0) # Flag to indicate a change in res or adrs for ADC
-ScopePower = Value('i',0) # Scope "power" on/off flag. 0=off, 1=on
-AD_Error_A = Value('i',0) # Error encountered by A/D routine
-
-ADchannel_A.value=1
-AD_Bits_A.value=12
-AD_Adrs1_A.value=Adrs1
-AD_Adrs2_A.value=Adrs2
-AD_Set_A.value=0
-ScopePower.value=0
-AD_Error_A.value=0
+#
+# The settings the A/D readers work from are kept together in one block of plain shared memory
+# with no lock around each field. The readers look at it on every pass, so a lock there would be
+# taken hundreds of times a second for values that hardly ever change. Instead the block carries
+# a sequence count. Control_Set makes it odd, writes the fields and makes it even again. A reader
+# compares the count with the last one it saw, and only when it has moved does it take a copy of
+# the whole block (Control_Read). The lock is only used by the GUI side to keep two changes from
+# being made at the same time, and to wake any reader that is sitting idle waiting for one.
+class Scope_Control(ctypes.Structure):
+    _fields_ = [("Seq",ctypes.c_int),       # Bumped twice by every change. Odd while one is being made
+                ("Power",ctypes.c_int),     # Scope "power" on/off flag. 0=off, 1=on
+                ("Error",ctypes.c_int),     # Error encountered by A/D routine
+                ("Chan",ctypes.c_int),      # Channel AD converter is to read
+                ("Chan_Set",ctypes.c_int*9),# Extra channels to scan along with Chan. 1=on. Element 0 unused
+                ("Bits",ctypes.c_int),      # Bits of ADC resolution passed to converter module
+                ("Adrs1",ctypes.c_int),     # i2c address of ADC channels 1-4
+                ("Adrs2",ctypes.c_int),     # i2c address of ADC channels 5-8
+                ("Set",ctypes.c_int),       # Bumped by one for each change in res or adrs for ADC
+                ("Parallel",ctypes.c_int),  # 1=one A/D reader process per converter chip, 0=one reader for both
+                ("Stream",ctypes.c_int),    # 1=read the converter in continuous conversion (streaming) mode
+                ("Trig_Thresh",ctypes.c_int), # 1=the readers look for the threshold trigger on Chan
+                ("Trig_Volts",ctypes.c_double), # Trigger threshold
+                ("Boxcar",ctypes.c_int)]    # Readings of each channel the A/D readers average. 1=off
+
+Scope_Ctl_A = RawValue(Scope_Control)
+Scope_Ctl_Cond = multiprocessing.Condition()
+
+Scope_Ctl_A.Chan=1
+Scope_Ctl_A.Bits=12
+Scope_Ctl_A.Adrs1=Adrs1
+Scope_Ctl_A.Adrs2=Adrs2
+Scope_Ctl_A.Trig_Volts=5.0
+Scope_Ctl_A.Boxcar=1
+
+# Trigger events. Where a trigger is detected its time, and the index of the reading it came with
+# (the sample ring's running count), is published with Trig_Publish. Seq works the same way as
+# Scope_Control's: it is odd while an event is being written, so a reader can tell it has caught
+# a write part done and try again. Each A/D
+# reader tests every reading of scope channel "A" against the threshold and publishes to its own
+# sample ring's Trig. A GPIO trigger pin is watched with an edge interrupt, which publishes to
+# Pin_Trig from RPi.GPIO's callback thread. Either way the time is that of the reading or the
+# edge itself, not of when the GUI next looked.
+class Trig_Event(ctypes.Structure):
+    _fields_ = [("Seq",ctypes.c_longlong),   # Bumped twice by every trigger. Odd while one is being written
+                ("Time",ctypes.c_double),    # Time of the latest
+                ("Index",ctypes.c_longlong)] # Sample ring count of the reading it came with
+
+# Publish a trigger. Each event has only the one writer, its A/D reader or the GPIO callback thread.
+def Trig_Publish(Event,Time_Stamp,Index):
+    Event.Seq += 1
+    Event.Time=Time_Stamp
+    Event.Index=Index
+    Event.Seq += 1
+
+# Take a consistent copy of a trigger event, trying again if a new one was being published.
+# Returns the number of triggers published so far and the time and index of the latest.
+def Trig_Read(Event):
+    while (True):
+        Seq=Event.Seq
+        if Seq & 1 == 0:
+            Time_Stamp=Event.Time
+            Index=Event.Index
+            if Event.Seq == Seq:
+                return Seq//2,Time_Stamp,Index
+
+# Change one or more settings, e.g. Control_Set(Power=1). The A/D reader sets Error with a plain
+# write, but the GUI clears it through here so an idle reader wakes up to the change.
+def Control_Set(**Fields):
+    with Scope_Ctl_Cond:
+        Scope_Ctl_A.Seq += 1
+        for Name in Fields:
+            setattr(Scope_Ctl_A,Name,Fields[Name])
+        Scope_Ctl_A.Seq += 1
+        Scope_Ctl_Cond.notify_all()
+
+# Take a consistent copy of the settings, trying again if a change was being made while copying
+def Control_Read(Ctl):
+    while (True):
+        Seq=Ctl.Seq
+        if Seq & 1 == 0:
+            Snap=Scope_Control.from_buffer_copy(Ctl)
+            if Snap.Seq == Seq and Ctl.Seq == Seq:
+                return Snap
+        time.sleep(0)
+
+# Run time statistics. Counters and timing histograms for the busy parts of the scope, so it can
+# be seen where the time goes on a loaded Pi without attaching a profiler. Each A/D reader keeps
+# its own in shared memory alongside its sample ring and the GUI keeps the rest in Scope_Stats.
+# Stats_Line gives a one line summary, which can be shown under the status message, Stats_Report
+# gives the lot and Stats_Dump writes that to a file. Started with --stats=FILE (or SCOPE_STATS=FILE
+# in the environment) the scope dumps them to FILE when it is closed.
+Stats_File = Option("--stats","SCOPE_STATS")
+Hist_Buckets=20 # Bucket n counts values from 2**(n-1) up to 2**n. Times are in microseconds.
+
+class Stat_Hist(ctypes.Structure):
+    _fields_ = [("Count",ctypes.c_ulonglong),
+                ("Total",ctypes.c_double),
+                ("Max",ctypes.c_double),
+                ("Buckets",ctypes.c_ulonglong*Hist_Buckets)]
+
+    def Add(self,Value):
+        self.Count += 1
+        self.Total += Value
+        if Value > self.Max:
+            self.Max=Value
+        self.Buckets[min(int(Value).bit_length(),Hist_Buckets-1)] += 1
+
+    def Mean(self):
+        return self.Total/self.Count if self.Count else 0.0
+
+    # Top of the bucket the Pct percent point falls in
+    def Percentile(self,Pct):
+        Seen=0
+        for n in range(Hist_Buckets):
+            Seen += self.Buckets[n]
+            if Seen and Seen >= self.Count*Pct/100.0:
+                return 1 << n
+        return 0
+
+    def Clear(self):
+        ctypes.memset(ctypes.addressof(self),0,ctypes.sizeof(self))
+
+class Reader_Stats(ctypes.Structure):
+    _fields_ = [("Loops",ctypes.c_ulonglong), # Passes round the A/D reader loop
+                ("Read",Stat_Hist)]           # Time each A/D read took
+
+class GUI_Stats:
+    def __init__(self):
+        self.Update=Stat_Hist() # Time Update_All took
+        self.Draw=Stat_Hist() # Time Draw_Samples took
+        self.Dropped=Stat_Hist() # Readings thrown away by each Draw_Samples, not drawn
+        self.Canvas=Stat_Hist() # Canvas calls made for each screen update
+        self.Trig=Stat_Hist() # Time from each trigger to the GUI starting its sweep
+        self.Canvas_Calls=0 # Canvas calls so far for the next screen update
+        self.Frames=0 # Frames that drew new readings
+        self.Frames_Skipped=0 # Frames skipped because drawing was falling behind
+        self.Drawn=0 # Readings put on the trace
+        self.Skipped=0 # Readings thrown away, all told
+        self.Start=time.time()
+        self.Line_Time=self.Start # Where Stats_Line's rates were last worked out from
+        self.Line_Counts=[0,0,0]
+
+    # Count the canvas calls since the last screen update as one update
+    def Frame_Done(self):
+        self.Canvas.Add(self.Canvas_Calls)
+        self.Canvas_Calls=0
+
+    # Count the readings Draw_Samples took from the rings and how many of them it drew
+    def Readings(self,Taken,Drawn):
+        self.Drawn += Drawn
+        self.Skipped += Taken-Drawn
+        self.Dropped.Add(Taken-Drawn)
+
+    # Readings already counted as thrown away that were drawn after all, from Scope_History
+    def Redrawn(self,Drawn):
+        self.Drawn += Drawn
+        self.Skipped -= Drawn
+
+Scope_Stats=GUI_Stats()
+
+# Profiling. Started with --profile=DIR (or SCOPE_PROFILE=DIR in the environment) each A/D reader
+# runs under its own profiler, and the GUI's profiler is switched on for each Update_All tick and
+# each batch of readings drawn, so time Tk spends waiting isn't counted. Every process also keeps
+# a timeline of its ticks (start time, seconds taken and what it was). When the scope is closed
+# each process writes its profile to DIR/<name>.prof, for pstats or snakeviz, and its timeline
+# to DIR/<name>_ticks.csv. The names are gui, reader1 and reader2. Where Python supports it the
+# perf trampoline is turned on too, so "perf record" can see the Python functions.
+Profile_Dir = Option("--profile","SCOPE_PROFILE")
+Profile_Ticks=100000 # Most recent ticks kept in the timeline
+Profile_Timeline=None # The timeline, in a process being profiled
+
+def Profile_Start():
+    global Profile_Timeline
+    Profile_Timeline=collections.deque(maxlen=Profile_Ticks)
+    if hasattr(sys,"activate_stack_trampoline"):
+        try:
+            sys.activate_stack_trampoline("perf")
+        except (ValueError,RuntimeError):
+            pass
+    return cProfile.Profile()
+
+def Profile_Save(Profiler,Name):
+    try:
+        os.makedirs(Profile_Dir,exist_ok=True)
+        Profiler.dump_stats(os.path.join(Profile_Dir,Name+".prof"))
+        with open(os.path.join(Profile_Dir,Name+"_ticks.csv"),"w") as Ticks_Out:
+            Ticks_Out.write("start,seconds,what\n")
+            for Tick in Profile_Timeline:
+                Ticks_Out.write("%.6f,%.6f,%s\n" % Tick)
+    except OSError:
+        pass
+
+# Wrap a GUI method so its profiler is on only while it runs, and each call goes on the timeline
+def Profile_Tick(Method,Name,Profiler):
+    def Profiled_Tick(*Args):
+        Start=time.time()
+        Profiler.enable()
+        try:
+            return Method(*Args)
+        finally:
+            Profiler.disable()
+            Profile_Timeline.append((Start,time.time()-Start,Name))
+    return Profiled_Tick
+
+# Ring buffer carrying every A/D reading from the reader process to the GUI. There is exactly
+# one writer (the A/D reader) and one reader (the GUI), so no lock is needed. The A/D reader only
+# ever moves Head and the GUI only ever moves Tail. Both are running sample counts and the slot
+# used is the count modulo the ring size, so full and empty can't be confused.
+class Sample_Ring:
+    def __init__(self,Size=4096):
+        self.Size=Size
+        self.Times=RawArray('d',Size) # Read time stamps. These can be quite large, so use double floats
+        # Raw counts returned from ADC. They are only turned into volts on the GUI side, in bulk,
+        # so the A/D reader does no float math per reading.
+        self.Codes=RawArray('i',Size)
+        self.Chans=RawArray('b',Size) # A/D channel each reading came from
+        self.Res=RawArray('b',Size) # A/D resolution (bits) of each reading's count
+        self.Head=RawValue('q',0) # Number of samples written by the A/D reader
+        self.Tail=RawValue('q',0) # Number of samples taken by the GUI
+        self.Overrun=RawValue('q',0) # Samples thrown away because the GUI fell a whole ring behind
+        self.Stats=RawValue(Reader_Stats) # Run time statistics, kept by the A/D reader
+        self.Trig=RawValue(Trig_Event) # Threshold triggers found by the A/D reader
+
+    # Called by the A/D reader only. If the ring is full the new sample is dropped rather than
+    # stepping on samples the GUI hasn't taken yet.
+    def Put(self,ReadTime,Code,Chan,Bits):
+        Head=self.Head.value
+        if Head-self.Tail.value >= self.Size:
+            self.Overrun.value += 1
+            return
+        Slot=Head % self.Size
+        self.Times[Slot]=ReadTime
+        self.Codes[Slot]=Code
+        self.Chans[Slot]=Chan
+        self.Res[Slot]=Bits
+        self.Head.value=Head+1 # Publish the sample only after its slot is filled in
+
+    # Called by the GUI only. Returns lists of all the time stamps, raw counts, channels and
+    # resolutions that arrived since the last drain, oldest first.
+    def Drain(self):
+        Head=self.Head.value
+        Tail=self.Tail.value
+        if Head == Tail:
+            return [],[],[],[]
+        First=Tail % self.Size
+        Last=Head % self.Size
+        if First < Last:
+            Times=self.Times[First:Last]
+            Codes=self.Codes[First:Last]
+            Chans=self.Chans[First:Last]
+            Res=self.Res[First:Last]
+        else: # The new samples wrap around the end of the ring
+            Times=self.Times[First:]+self.Times[:Last]
+            Codes=self.Codes[First:]+self.Codes[:Last]
+            Chans=self.Chans[First:]+self.Chans[:Last]
+            Res=self.Res[First:]+self.Res[:Last]
+        self.Tail.value=Head
+        return Times,Codes,Chans,Res
+
+    # Called by the GUI only. Throw away everything not taken yet. Returns how many that was.
+    def Skip(self):
+        Head=self.Head.value
+        Skipped=Head-self.Tail.value
+        self.Tail.value=Head
+        return Skipped
+
+# One ring per A/D reader process. Element 0 is filled by the reader for the Adrs1 chip
+# (channels 1-4), or by the only reader when not in parallel mode. Element 1 is filled by the
+# reader for the Adrs2 chip (channels 5-8) in parallel mode.
+Sample_Rings=[Sample_Ring(),Sample_Ring()]
+
+# Split drained readings into runs taken at one A/D resolution. Returns [first, end, bits] for
+# each run. Readings still in a ring when the resolution is changed keep the one they were
+# taken at.
+def Bits_Runs(Res):
+    if not Res:
+        return []
+    if Res.count(Res[0]) == len(Res): # The usual case. One resolution throughout.
+        return [[0,len(Res),Res[0]]]
+    Runs=[]
+    First=0
+    for k in range(1,len(Res)):
+        if Res[k] != Res[k-1]:
+            Runs.append([First,k,Res[First]])
+            First=k
+    Runs.append([First,len(Res),Res[First]])
+    return Runs
+
+# Called by the GUI only. Drain every ring and return all the new readings as one batch, with
+# the raw counts turned into volts. The readings of each channel are in time order, but the
+# batch as a whole may not be. When recording, the raw readings are passed to the recorder too.
+def Drain_Rings():
+    Times=[]
+    Volts=[]
+    Chans=[]
+    for Ring in Sample_Rings:
+        Ring_Times,Codes,Ring_Chans,Res=Ring.Drain()
+        for First,End,Bits in Bits_Runs(Res):
+            if Scope_Recorder:
+                Scope_Recorder.Add(Ring_Times[First:End],Codes[First:End],Ring_Chans[First:End],Bits)
+            Volts=Volts+Codes_To_Volts(Codes[First:End],Bits)
+        Times=Times+Ring_Times
+        Chans=Chans+Ring_Chans
+    return Times,Volts,Chans
+
+# Called by the GUI only. Throw away everything not taken yet from every ring. The readings
+# aren't drawn, but when recording they still have to go to the recorder.
+def Skip_Rings():
+    Skipped=0
+    for Ring in Sample_Rings:
+        if Scope_Recorder:
+            Times,Codes,Chans,Res=Ring.Drain()
+            for First,End,Bits in Bits_Runs(Res):
+                Scope_Recorder.Add(Times[First:End],Codes[First:End],Chans[First:End],Bits)
+            Skipped += len(Times)
+        else:
+            Skipped += Ring.Skip()
+    Scope_Stats.Readings(Skipped,0)
+
+# The most recent readings the GUI has taken from the rings, whether they were drawn or not, so
+# a triggered sweep can show what led up to the trigger. Draw_Samples adds every batch it drains.
+# When a trigger comes the new trace starts Trig_Position percent of the screen before it, and
+# whatever of that is still here is drawn first. There are no extra A/D reads. Like Sample_Ring,
+# the slot used is a running count modulo the size.
+History_Size=8192 # Over 15 seconds of readings with both chips running flat out
+
+class Sample_History:
+    def __init__(self,Size=History_Size):
+        self.Size=Size
+        self.Times=array('d',bytes(8*Size))
+        self.Volts=array('d',bytes(8*Size))
+        self.Chans=array('b',bytes(Size))
+        self.Count=0 # Readings added, all told
+
+    def Add(self,Times,Volts,Chans):
+        if len(Times) > self.Size: # Only the newest Size readings can be kept anyway
+            Times=Times[-self.Size:]
+            Volts=Volts[-self.Size:]
+            Chans=Chans[-self.Size:]
+        Slot=self.Count % self.Size
+        Fits=min(len(Times),self.Size-Slot) # The rest wraps round to the start
+        self.Times[Slot:Slot+Fits]=array('d',Times[:Fits])
+        self.Volts[Slot:Slot+Fits]=array('d',Volts[:Fits])
+        self.Chans[Slot:Slot+Fits]=array('b',Chans[:Fits])
+        Rest=len(Times)-Fits
+        self.Times[:Rest]=array('d',Times[Fits:])
+        self.Volts[:Rest]=array('d',Volts[Fits:])
+        self.Chans[:Rest]=array('b',Chans[Fits:])
+        self.Count += len(Times)
+
+    # The readings time stamped at or after T, oldest added first
+    def Since(self,T):
+        if self.Count <= self.Size:
+            Order=range(self.Count)
+        else:
+            Slot=self.Count % self.Size
+            Order=list(range(Slot,self.Size))+list(range(Slot))
+        Keep=[k for k in Order if self.Times[k] >= T]
+        return [self.Times[k] for k in Keep],[self.Volts[k] for k in Keep],[self.Chans[k] for k in Keep]
+
+Scope_History=Sample_History()
+
+# GPIO trigger pin events, published by Pin_Trigger. The index is that of the next reading from
+# the first A/D reader.
+Pin_Trig=Trig_Event()
+Trig_Pin_Watched=0 # Trigger the edge interrupt is set up for, 1-8, or 0 for none
+
+# Called by RPi.GPIO, in its own thread, on a rising edge of the watched trigger pin
+def Pin_Trigger(Pin):
+    Trig_Publish(Pin_Trig,time.time(),Sample_Rings[0].Head.value)
+
+# Watch trigger Trig (1-8) with an edge interrupt instead of the one before, or none if Trig is
+# 0 or 9. Returns False if the pin can't be watched, e.g. it is set up as an output. It is
+# then polled by Update_All as before.
+def Trig_Pin_Watch(Trig):
+    global Trig_Pin_Watched
+    if Trig_Pin_Watched:
+        GPIO.remove_event_detect(Trig_Pin_GPIO[Trig_Pin_Watched])
+        Trig_Pin_Watched=0
+    if 0 < Trig < 9:
+        try:
+            GPIO.add_event_detect(Trig_Pin_GPIO[Trig],GPIO.RISING,callback=Pin_Trigger)
+        except RuntimeError:
+            return False
+        Trig_Pin_Watched=Trig
+    return True
+
+Trig_Events=[Sample_Rings[0].Trig,Sample_Rings[1].Trig,Pin_Trig]
+Trig_Seen=[0]*len(Trig_Events) # Count of each when last looked at
+
+# Called by the GUI only. The time and index of the newest trigger published since the last
+# call, or None if there hasn't been one.
+def Trigger_Poll():
+    Newest=None
+    for n in range(len(Trig_Events)):
+        Count,Time_Stamp,Index=Trig_Read(Trig_Events[n])
+        if Count != Trig_Seen[n]:
+            Trig_Seen[n]=Count
+            if Newest is None or Time_Stamp > Newest[0]:
+                Newest=(Time_Stamp,Index)
+    return Newest
+
+# One line summary of the statistics, with rates worked out since the last call
+def Stats_Line():
+    Now=time.time()
+    Secs=max(Now-Scope_Stats.Line_Time,0.001)
+    Counts=[Sample_Rings[0].Stats.Loops+Sample_Rings[1].Stats.Loops,
+            Sample_Rings[0].Head.value+Sample_Rings[1].Head.value,Scope_Stats.Skipped]
+    Rates=[(Counts[n]-Scope_Stats.Line_Counts[n])/Secs for n in range(3)]
+    Scope_Stats.Line_Time=Now
+    Scope_Stats.Line_Counts=Counts
+    Reads=Sample_Rings[0].Stats.Read.Count+Sample_Rings[1].Stats.Read.Count
+    Read_Time=(Sample_Rings[0].Stats.Read.Total+Sample_Rings[1].Stats.Read.Total)/max(Reads,1)
+    return "A/D %.0f/s read %.1fms drop %.0f/s upd %.2fms draw %.2fms cv %.1f/f" % \
+           (Rates[1],Read_Time/1000.0,Rates[2],Scope_Stats.Update.Mean()/1000.0,
+            Scope_Stats.Draw.Mean()/1000.0,Scope_Stats.Canvas.Mean())
+
+# Every statistic kept, as a list of lines of text
+def Stats_Report():
+    Secs=max(time.time()-Scope_Stats.Start,0.001)
+    Lines=["Scope statistics over %.1f seconds" % Secs]
+    def Hist_Lines(Name,Hist,Unit):
+        Lines.append("%-22s %9d  mean %10.1f  95%% < %8d  max %10.1f %s" %
+                     (Name,Hist.Count,Hist.Mean(),Hist.Percentile(95),Hist.Max,Unit))
+        if Hist.Count:
+            Lines.append("    "+" ".join("<%d:%d" % (1 << n,Hist.Buckets[n])
+                                          for n in range(Hist_Buckets) if Hist.Buckets[n]))
+    for n in range(len(Sample_Rings)):
+        Ring=Sample_Rings[n]
+        Lines.append("A/D reader %d: %d loops (%.1f/s), %d readings (%.1f/s), %d lost to overruns" %
+                     (n+1,Ring.Stats.Loops,Ring.Stats.Loops/Secs,Ring.Head.value,Ring.Head.value/Secs,
+                      Ring.Overrun.value))
+        Hist_Lines("  A/D read time",Ring.Stats.Read,"us")
+    Lines.append("GUI: %d readings drawn, %d thrown away" % (Scope_Stats.Drawn,Scope_Stats.Skipped))
+    Lines.append("GUI: %d frames drawn (%.1f/s), %d skipped" %
+                 (Scope_Stats.Frames,Scope_Stats.Frames/Secs,Scope_Stats.Frames_Skipped))
+    Hist_Lines("  Update_All time",Scope_Stats.Update,"us")
+    Hist_Lines("  Draw_Samples time",Scope_Stats.Draw,"us")
+    Hist_Lines("  Dropped per draw",Scope_Stats.Dropped,"readings")
+    Hist_Lines("  Canvas calls/frame",Scope_Stats.Canvas,"calls")
+    Hist_Lines("  Trigger to sweep",Scope_Stats.Trig,"us")
+    return Lines
+
+def Stats_Dump(File_Name):
+    try:
+        with open(File_Name,"w") as Stats_Out:
+            Stats_Out.write("\n".join(Stats_Report())+"\n")
+    except OSError:
+        pass
+
+def Stats_Reset():
+    global Scope_Stats
+    for Ring in Sample_Rings:
+        Ring.Stats.Loops=0
+        Ring.Stats.Read.Clear()
+    Scope_Stats=GUI_Stats()
+
+# Recording. While the REC button is on, every reading taken from the rings, drawn or not, is
+# written to disk as it stands, raw count and all. Started with --record=DIR (or SCOPE_RECORD=DIR
+# in the environment) the scope starts recording into DIR straight away, for unattended logging.
+# Otherwise recordings go in the current directory. Each recording file is
+#   a header: Rec_Header, giving the magic string, the header and record sizes, the A/D
+#             resolution, both i2c addresses and the time recording started
+#   records:  Rec_Record, one per reading. Time stamp, A/D channel and raw count.
+# all little endian. A file holds one A/D resolution and one unbroken run of readings. If the
+# resolution is changed, or no readings come for Rec_Gap seconds, a new file is started. Each
+# file also gets summary files (see Mip_Writer). The drawing side only queues readings. A writer
+# thread packs them and writes them out in whole Rec_Block blocks, which suits SD cards, with
+# whatever is left over written every Rec_Flush seconds so little is lost if the power goes.
+Record_Dir = Option("--record","SCOPE_RECORD")
+Rec_Magic=b"SSCOPE\x00\x01"
+Rec_Header=struct.Struct("<8sHHiiid")
+Rec_Record=struct.Struct("<dBi")
+Rec_Block=65536 # Bytes
+Rec_Flush=10.0 # Seconds
+Rec_Gap=60.0 # Seconds
+
+# Summaries of a recording for zoomed out playback, built while recording. For a recording file
+# NAME there are Mip_Levels summary files NAME.m0, NAME.m1... Level 0 cuts the recording into
+# Mip_Slot second time slots, and each level's slots are Mip_Factor times longer than the one
+# below. A summary file is
+#   a header: Mip_Header, giving the magic string, the header and record sizes, the level, the
+#             number of channels, the time stamp slot 0 starts at and the slot length
+#   records:  Mip_Record, one per time slot, empty slots included. For each A/D channel the
+#             lowest and highest raw count, the number of readings and their sum.
+# Slot n of a level is always record n, so the summaries for any stretch of time are read
+# straight from where they are. Zoomed right out, playback reads about one summary per pixel
+# column from the level that fits, not every reading.
+Mip_Slot=0.25 # Seconds
+Mip_Factor=16
+Mip_Levels=4 # 0.25, 4, 64 and 1024 second slots
+Mip_Chans=8
+Mip_Grace=4 # Level 0 slots held open for late readings. The rings are drained a batch at a time.
+Mip_Magic=b"SSMIP\x00\x00\x01"
+Mip_Header=struct.Struct("<8sHHHHdd")
+Mip_Record=struct.Struct("<"+"iiId"*Mip_Chans)
+
+class Mip_Writer:
+    def __init__(self,File_Name):
+        self.File_Name=File_Name
+        self.Files=[] # One per level, opened when the first readings come
+        self.Base=0.0 # Time stamp level 0 slot 0 starts at
+        self.Open_Slots={} # Level 0 slots still taking readings. Slot number: summary.
+        self.Next_Slot=0 # Next level 0 slot to be written
+        self.Upper=[None]*Mip_Levels # Summary building for the current slot of each level above 0
+
+    # An empty summary. Lowest, highest, number of readings and sum for each channel.
+    def New_Summary(self):
+        return [[0,0,0,0.0] for Chan in range(Mip_Chans)]
+
+    def Merge(self,Into,Summary):
+        for Chan in range(Mip_Chans):
+            Mine=Into[Chan]
+            Theirs=Summary[Chan]
+            if Theirs[2]:
+                if Mine[2] == 0:
+                    Mine[0]=Theirs[0]
+                    Mine[1]=Theirs[1]
+                else:
+                    Mine[0]=min(Mine[0],Theirs[0])
+                    Mine[1]=max(Mine[1],Theirs[1])
+                Mine[2] += Theirs[2]
+                Mine[3] += Theirs[3]
+
+    def Add(self,Times,Chans,Codes):
+        if not self.Files:
+            self.Base=min(Times)
+            for Level in range(Mip_Levels):
+                Mip_File=open(self.File_Name+".m%d" % Level,"wb")
+                Mip_File.write(Mip_Header.pack(Mip_Magic,Mip_Header.size,Mip_Record.size,Level,Mip_Chans,
+                                               self.Base,Mip_Slot*Mip_Factor**Level))
+                self.Files.append(Mip_File)
+        for k in range(len(Times)):
+            Slot=max(int((Times[k]-self.Base)/Mip_Slot),self.Next_Slot)
+            if Slot not in self.Open_Slots:
+                self.Open_Slots[Slot]=self.New_Summary()
+            Chan_Sum=self.Open_Slots[Slot][(Chans[k]-1) % Mip_Chans]
+            Code=Codes[k]
+            if Chan_Sum[2] == 0:
+                Chan_Sum[0]=Code
+                Chan_Sum[1]=Code
+            elif Code < Chan_Sum[0]:
+                Chan_Sum[0]=Code
+            elif Code > Chan_Sum[1]:
+                Chan_Sum[1]=Code
+            Chan_Sum[2] += 1
+            Chan_Sum[3] += Code
+        self.Finish_Slots(max(self.Open_Slots)-Mip_Grace)
+
+    # Write out level 0 slots up to Last and any higher level slots that completes
+    def Finish_Slots(self,Last):
+        while self.Next_Slot <= Last:
+            Summary=self.Open_Slots.pop(self.Next_Slot,None) or self.New_Summary()
+            self.Write(0,Summary)
+            self.Next_Slot += 1
+            for Level in range(1,Mip_Levels):
+                if self.Upper[Level] is None:
+                    self.Upper[Level]=self.New_Summary()
+                self.Merge(self.Upper[Level],Summary)
+                if self.Next_Slot % Mip_Factor**Level:
+                    break
+                Summary=self.Upper[Level]
+                self.Write(Level,Summary)
+                self.Upper[Level]=None
+
+    def Write(self,Level,Summary):
+        self.Files[Level].write(Mip_Record.pack(*[Value for Chan_Sum in Summary for Value in Chan_Sum]))
+
+    # Write out everything, part filled slots at the end included, and close the files
+    def Close(self):
+        if not self.Files:
+            return
+        if self.Open_Slots:
+            self.Finish_Slots(max(self.Open_Slots))
+        Part=None # The part filled slot of the level below
+        for Level in range(1,Mip_Levels):
+            if Part is not None:
+                if self.Upper[Level] is None:
+                    self.Upper[Level]=self.New_Summary()
+                self.Merge(self.Upper[Level],Part)
+            Part=self.Upper[Level]
+            if Part is not None:
+                self.Write(Level,Part)
+        for Mip_File in self.Files:
+            Mip_File.close()
+        self.Files=[]
+
+class Recorder:
+    def __init__(self,Dir):
+        self.Dir=Dir
+        self.Queue=queue.Queue()
+        self.File=None
+        self.File_Name=""
+        self.Stamp=datetime.now().strftime("Scope_%Y%m%d_%H%M%S") # Start of the file names
+        self.Part=0 # Files started
+        self.Mip=None # Mip_Writer for the file being written
+        self.Last_Time=0.0 # Time stamp of the latest reading written
+        self.Bits=None # A/D resolution of the file being written
+        self.Records=0 # Readings recorded, all files
+        self.Bytes=0 # Bytes written, all files
+        self.Error=None # Description of the last write problem, if any
+        self.Failed=False # A file couldn't be opened. Nothing more is recorded.
+        self.Writer_Thread=threading.Thread(target=self.Writer,name="Recorder",daemon=True)
+        self.Writer_Thread.start()
+
+    # Called by the GUI. Queue a batch of readings to be written.
+    def Add(self,Times,Codes,Chans,Bits):
+        if Times and not self.Failed:
+            self.Queue.put((Times,Codes,Chans,Bits))
+
+    # Called by the GUI. Write out everything queued, close the file and stop the writer.
+    def Stop(self):
+        self.Queue.put(None)
+        self.Writer_Thread.join()
+
+    def Writer(self):
+        Buffer=bytearray()
+        Flush_Time=time.time()+Rec_Flush
+        while (True):
+            try:
+                Batch=self.Queue.get(timeout=Rec_Flush)
+            except queue.Empty:
+                Batch=()
+            if Batch is None:
+                break
+            if Batch and not self.Failed:
+                Times,Codes,Chans,Bits=Batch
+                # Each resolution, and each run of readings without a long gap, gets a file of its own
+                if Bits != self.Bits or Times[0]-self.Last_Time > Rec_Gap:
+                    self.Write(Buffer)
+                    Buffer=bytearray()
+                    self.Open(Bits)
+                if self.File is None: # The GUI sees Failed and turns recording off
+                    self.Failed=True
+                    continue
+                Pack=Rec_Record.pack
+                for k in range(len(Times)):
+                    Buffer += Pack(Times[k],Chans[k],Codes[k])
+                self.Records += len(Times)
+                self.Last_Time=max(self.Last_Time,Times[-1])
+                try:
+                    self.Mip.Add(Times,Chans,Codes)
+                except OSError as Problem:
+                    self.Error=str(Problem)
+            if len(Buffer) >= Rec_Block:
+                Whole=len(Buffer)-len(Buffer) % Rec_Block
+                self.Write(Buffer[:Whole])
+                del Buffer[:Whole]
+            if time.time() >= Flush_Time:
+                self.Write(Buffer)
+                Buffer=bytearray()
+                Flush_Time=time.time()+Rec_Flush
+        self.Write(Buffer)
+        self.Close()
+
+    def Open(self,Bits):
+        self.Close()
+        self.Bits=Bits
+        self.Part += 1
+        self.File_Name=os.path.join(self.Dir,"%s_%02d_%dbit.ssr" % (self.Stamp,self.Part,Bits))
+        try:
+            os.makedirs(self.Dir,exist_ok=True)
+            self.File=open(self.File_Name,"ab",buffering=0)
+            self.Mip=Mip_Writer(self.File_Name)
+            self.Write(Rec_Header.pack(Rec_Magic,Rec_Header.size,Rec_Record.size,Bits,
+                                       Scope_Ctl_A.Adrs1,Scope_Ctl_A.Adrs2,time.time()))
+        except OSError as Problem:
+            self.Close()
+            self.Error=str(Problem)
+
+    def Write(self,Data):
+        if self.File is None or not Data:
+            return
+        try:
+            self.File.write(Data)
+            self.Bytes += len(Data)
+        except OSError as Problem:
+            self.Error=str(Problem)
+
+    def Close(self):
+        if self.File is not None:
+            self.File.close()
+            self.File=None
+        if self.Mip is not None:
+            try:
+                self.Mip.Close()
+            except OSError as Problem:
+                self.Error=str(Problem)
+            self.Mip=None
+
+Scope_Recorder=None # The Recorder while recording is on
+
+# Playback of a recording. The file is memory mapped, not read in, so even one many hours long
+# opens at once and takes no more RAM than the part of it on the screen. Records are a fixed
+# size, so record n is found directly and the window on the screen is found by a binary search
+# on the time stamps. Only the records in the window are decoded. Zoomed out far enough, the
+# recording's summary files are read instead.
+if numpy is not None:
+    Rec_Dtype=numpy.dtype([("Time","<f8"),("Chan","u1"),("Code","<i4")]) # The same as Rec_Record
+    Mip_Dtype=numpy.dtype([("Min","<i4"),("Max","<i4"),("Count","<u4"),("Sum","<f8")]) # One channel of Mip_Record
+
+class Recording:
+    def __init__(self,File_Name):
+        self.File=open(File_Name,"rb")
+        try:
+            self.Map=mmap.mmap(self.File.fileno(),0,access=mmap.ACCESS_READ)
+            Magic,self.Header_Size,self.Record_Size,self.Bits,self.Adrs1,self.Adrs2,self.Start_Time= \
+                Rec_Header.unpack_from(self.Map,0)
+        except (ValueError,struct.error):
+            self.File.close()
+            raise ValueError("Not a scope recording")
+        if Magic != Rec_Magic or self.Record_Size != Rec_Record.size:
+            self.Close()
+            raise ValueError("Not a scope recording")
+        self.Count=(len(self.Map)-self.Header_Size)//self.Record_Size
+        if self.Count == 0:
+            self.Close()
+            raise ValueError("Recording is empty")
+        self.First_Time=self.Time_At(0)
+        self.Last_Time=self.Time_At(self.Count-1)
+        # The summary levels there are, each as [file, map, slot 0 start time, slot length, slots]
+        self.Mips=[]
+        for Level in range(Mip_Levels):
+            try:
+                Mip_File=open(File_Name+".m%d" % Level,"rb")
+            except OSError:
+                break
+            try:
+                Mip_Map=mmap.mmap(Mip_File.fileno(),0,access=mmap.ACCESS_READ)
+                Magic,Header_Size,Record_Size,Mip_Level,Chans,Base,Slot=Mip_Header.unpack_from(Mip_Map,0)
+            except (ValueError,struct.error):
+                Mip_File.close()
+                break
+            if Magic != Mip_Magic or Header_Size != Mip_Header.size or Record_Size != Mip_Record.size:
+                Mip_Map.close()
+                Mip_File.close()
+                break
+            self.Mips.append([Mip_File,Mip_Map,Base,Slot,(len(Mip_Map)-Header_Size)//Record_Size])
+
+    def Time_At(self,Index):
+        return struct.unpack_from("<d",self.Map,self.Header_Size+Index*self.Record_Size)[0]
+
+    # Index of the first record at or after time T. The two A/D readers' readings are written a
+    # batch at a time, so the records are only in time order give or take a ring's worth. The
+    # search is backed off by that much to be sure, and Window throws out what isn't wanted.
+    def Find(self,T):
+        Lo=0
+        Hi=self.Count
+        while Lo < Hi:
+            Mid=(Lo+Hi)//2
+            if self.Time_At(Mid) < T:
+                Lo=Mid+1
+            else:
+                Hi=Mid
+        return Lo
+
+    # Time stamps, raw counts and channels of records First up to Last
+    def Records(self,First,Last):
+        Offset=self.Header_Size+First*self.Record_Size
+        if numpy is not None:
+            Recs=numpy.frombuffer(self.Map,dtype=Rec_Dtype,count=Last-First,offset=Offset)
+            # Copied, so nothing is left holding on to the map
+            return numpy.array(Recs["Time"]),numpy.array(Recs["Code"]),numpy.array(Recs["Chan"])
+        Times=[]
+        Codes=[]
+        Chans=[]
+        with memoryview(self.Map) as View:
+            for Time_Stamp,Chan,Code in Rec_Record.iter_unpack(View[Offset:Offset+(Last-First)*self.Record_Size]):
+                Times.append(Time_Stamp)
+                Codes.append(Code)
+                Chans.append(Chan)
+        return Times,Codes,Chans
+
+    # Summary of the readings from Start for Span seconds, in Columns or more time slots, from
+    # the coarsest summary level that has slots that short. Returns the level's slot length,
+    # the time the summaries run up to (the end of the last one there is, which while the file
+    # is still being recorded can be before Start+Span) and, for each channel with readings,
+    # lists of slot start times and the lowest, highest and mean volts in each slot. Returns
+    # None if even level 0 is too coarse, or there are no summary files.
+    def Summary(self,Start,Span,Columns):
+        Use=None
+        for Mip in self.Mips:
+            if Mip[3] <= Span/Columns:
+                Use=Mip
+        if Use is None:
+            return None
+        Mip_File,Mip_Map,Base,Slot,Slots=Use
+        First=min(max(int((Start-Base)/Slot),0),Slots)
+        Last=min(max(int(math.ceil((Start+Span-Base)/Slot)),First),Slots)
+        Offset=Mip_Header.size+First*Mip_Record.size
+        Split={}
+        if numpy is not None:
+            Sums=numpy.frombuffer(Mip_Map,dtype=Mip_Dtype,count=(Last-First)*Mip_Chans,offset=Offset)
+            Sums=Sums.reshape(Last-First,Mip_Chans)
+            Slot_Times=Base+Slot*numpy.arange(First,Last)
+            for Chan in range(1,Mip_Chans+1):
+                Chan_Sums=Sums[:,Chan-1]
+                Have=Chan_Sums["Count"] > 0
+                if Have.any():
+                    Chan_Sums=Chan_Sums[Have]
+                    Split[Chan]=(Slot_Times[Have].tolist(),Codes_To_Volts(Chan_Sums["Min"],self.Bits),
+                                 Codes_To_Volts(Chan_Sums["Max"],self.Bits),
+                                 Codes_To_Volts(Chan_Sums["Sum"]/Chan_Sums["Count"],self.Bits))
+            return Slot,Base+Slot*Last,Split
+        Mins={}
+        Maxs={}
+        Means={}
+        with memoryview(Mip_Map) as View:
+            for n,Values in enumerate(Mip_Record.iter_unpack(View[Offset:Offset+(Last-First)*Mip_Record.size])):
+                for Chan in range(1,Mip_Chans+1):
+                    Low,High,Count,Total=Values[4*Chan-4:4*Chan]
+                    if Count:
+                        Split.setdefault(Chan,[]).append(Base+Slot*(First+n))
+                        Mins.setdefault(Chan,[]).append(Low)
+                        Maxs.setdefault(Chan,[]).append(High)
+                        Means.setdefault(Chan,[]).append(Total/Count)
+        for Chan in Split:
+            Split[Chan]=(Split[Chan],Codes_To_Volts(Mins[Chan],self.Bits),Codes_To_Volts(Maxs[Chan],self.Bits),
+                         Codes_To_Volts(Means[Chan],self.Bits))
+        return Slot,Base+Slot*Last,Split
+
+    # The readings from Start for Span seconds, split by channel as Split_Channels does, with
+    # the counts turned into volts. Where there are more than Columns*4 readings of a channel,
+    # only the lowest and highest in each of Columns time slots are kept, in time order, which
+    # is all that can be seen of them anyway. Zoomed out to a summary slot or more per column,
+    # the lowest and highest of each slot come from the summary files, and only any part of the
+    # window the summaries don't cover yet is read from the records.
+    def Window(self,Start,Span,Columns):
+        Summary=self.Summary(Start,Span,Columns)
+        if Summary is None:
+            return self.Read_Window(Start,Span,Columns)
+        Slot,Covered,Split=Summary
+        for Chan in Split:
+            Times,Mins,Maxs,Means=Split[Chan]
+            Split[Chan]=([T+Offset for T in Times for Offset in (0.0,Slot/2)],
+                         [Volts for Pair in zip(Mins,Maxs) for Volts in Pair])
+        if Covered < Start+Span:
+            Tail=Start+Span-Covered
+            for Chan,(Times,Volts) in self.Read_Window(Covered,Tail,max(int(Columns*Tail/Span),1)).items():
+                Old_Times,Old_Volts=Split.get(Chan,([],[]))
+                Split[Chan]=(Old_Times+Times,Old_Volts+Volts)
+        return Split
+
+    def Read_Window(self,Start,Span,Columns):
+        First=max(self.Find(Start)-Sample_Rings[0].Size,0)
+        Last=min(self.Find(Start+Span)+Sample_Rings[0].Size,self.Count)
+        Times,Codes,Chans=self.Records(First,Last)
+        Split={}
+        if numpy is not None:
+            In_Window=(Times >= Start) & (Times < Start+Span)
+            Times=Times[In_Window]
+            Codes=Codes[In_Window]
+            Chans=Chans[In_Window]
+            for Chan in numpy.unique(Chans).tolist():
+                Mine=Chans == Chan
+                Chan_Times=Times[Mine]
+                Chan_Codes=Codes[Mine]
+                Order=numpy.argsort(Chan_Times,kind="stable")
+                Chan_Times=Chan_Times[Order]
+                Chan_Codes=Chan_Codes[Order]
+                if len(Chan_Times) > Columns*4:
+                    Col=((Chan_Times-Start)*(Columns/Span)).astype(numpy.int64)
+                    By_Col=numpy.lexsort((Chan_Codes,Col)) # Slot by slot, lowest count first
+                    Col=Col[By_Col]
+                    Firsts=numpy.flatnonzero(numpy.r_[True,Col[1:] != Col[:-1]])
+                    Lasts=numpy.r_[Firsts[1:]-1,len(Col)-1]
+                    Keep=numpy.unique(numpy.r_[By_Col[Firsts],By_Col[Lasts]])
+                    Chan_Times=Chan_Times[Keep]
+                    Chan_Codes=Chan_Codes[Keep]
+                Split[Chan]=(Chan_Times.tolist(),Codes_To_Volts(Chan_Codes,self.Bits))
+            return Split
+        Keep_Times={}
+        Keep_Codes={}
+        for k in range(len(Times)):
+            if Start <= Times[k] < Start+Span:
+                Keep_Times.setdefault(Chans[k],[]).append(Times[k])
+                Keep_Codes.setdefault(Chans[k],[]).append(Codes[k])
+        for Chan in Keep_Times:
+            Pairs=sorted(zip(Keep_Times[Chan],Keep_Codes[Chan]))
+            if len(Pairs) > Columns*4:
+                Slots={}
+                for Pair in Pairs:
+                    Col=int((Pair[0]-Start)*(Columns/Span))
+                    if Col not in Slots:
+                        Slots[Col]=[Pair,Pair]
+                    elif Pair[1] < Slots[Col][0][1]:
+                        Slots[Col][0]=Pair
+                    elif Pair[1] > Slots[Col][1][1]:
+                        Slots[Col][1]=Pair
+                Pairs=sorted(set(Pair for Slot in Slots.values() for Pair in Slot))
+            Split[Chan]=([Pair[0] for Pair in Pairs],Codes_To_Volts([Pair[1] for Pair in Pairs],self.Bits))
+        return Split
+
+    def Close(self):
+        self.Map.close()
+        self.File.close()
+        for Mip in self.Mips:
+            Mip[1].close()
+            Mip[0].close()
+        self.Mips=[]
+
+Scope_Playback=None # The Recording being played back. While there is one, live drawing stops.
+
+# Wake up pipe. The A/D reader writes a byte into it for every reading it puts in the ring, so
+# the GUI can sit idle in the Tk mainloop until there is something new to draw. Both ends are
+# non-blocking. If the pipe ever fills up the GUI already has a wake up waiting, so the A/D
+# reader just carries on.
+Wake_Read_A,Wake_Write_A=os.pipe()
+os.set_blocking(Wake_Read_A,False)
+os.set_blocking(Wake_Write_A,False)
 
 
 # Set up some universal variables
 xScale_time = 1.0 # Default x axis scale to 1 second time
 yScale_volts = 5.0 # Default y axis scale to 5 volts
-x1 = 0
-y1 = 0
-x2 = 0
-y2 = 0
-LinePtr=0 # Pointer to the next tkinter canvas line ID.
+LinePtr=0 # Number of readings drawn in the current trace
 pix_width=790 # Scope trace area width in pixels including axis label area
-Max_Lines=pix_width+200 # Maximum number of trace lines (may need plenty!)
 pix_height=340 # Scope trace area height in pixels including axis label area
 Y_Lab_width=70 # Pixels on left trace area reserved for Y axis ticks and labels
 X_Lab_height=50 # Pixels on bottom trace area reserved for X axis ticks and labels
@@ -131,16 +1072,19 @@ FaultCode=0 # Some failure caused this suite to bomb. The reason is put in here.
             # 1-3 = AD routine not updating convert time. Probably not running.
 TraceStartTime=0.0
 StartNewTrace=True # Start up with a new trace
-LastLine=False
+FirstPoint_A=True # Waiting for the first reading of a new trace
 ContinuousSweepA=True # Start up using continuous sweep
 SingleSweepA=False
+Roll_Mode=False # Roll (strip chart) display instead of sweeps
 Sel_Chan=1 # Start up default A/D channel is 1
-Time_x1=ReadTime_A.value # Needs to be double float
-Time_x2=ReadTime_A.value # Needs to be double float
-Volts_y1=0.0
-Volts_y2=0.0
 Threshold_A=5.0 # Initialize trace color threshold
+# Trace colors used in multi-channel mode. The scope channel "A" trace (the selected channel) is always
+# green, the extra channels use the color of their number here, and any line at or over the
+# color threshold is red. Element 0 is unused.
+Chan_Colors=["green","cyan","magenta","orange","white","deep sky blue","pink","gold","violet"]
 TrigThresh_A=5.0 # Initialize trigger threshold
+Trig_Position=10 # Percent of the screen shown before the trigger
+Trig_Time=None # Time of the trigger the next trace starts from, if it is a triggered one
 Thresh_A=False
 ThreshA_On_Off=2
 SweepSelectA=1
@@ -302,27 +1246,940 @@ def askstring(title, prompt, **kw): # String input box suite
     return d.result
 
 
-# Define the ADC reader portion, which will run as a separate process by itself
-
-def ADC_Reader_A(ADchannel_A,ADvalue_A,ReadTime_A,AD_Bits_A,AD_Adrs1_A,AD_Adrs2_A,
-                 AD_Set_A,ScopePower,AD_Error_A):
+# Streaming mode support for the MCP3424 converters on the ADC Pi. The ABE library sends the
+# configuration byte to the chip ahead of every read, which restarts the conversion, so the real
+# sample rate falls well short of the rated one. In streaming mode the configuration is written
+# once, the chip is left in continuous conversion on one channel, and the result bytes are read
+# straight from the i2c device with no command byte in front. The chip is only reconfigured when
+# the channel, resolution or address changes.
+I2C_SLAVE=0x0703 # ioctl to set the i2c address for the reads and writes that follow
+MCP_RDY=0x80 # In the config byte read back: 1 = no new result since the last read
+MCP_CONT=0x10 # Continuous conversion mode
+MCP_Rate_Bits={12:0x00,14:0x04,16:0x08,18:0x0C} # Sample rate (resolution) select. PGA gain is x1
+MCP_Period={12:1.0/240,14:1.0/60,16:1.0/15,18:1.0/3.75} # Seconds per conversion at each resolution
+MCP_Wait=4 # Conversion periods Read waits for a new result before giving up
+AD_LSB={12:0.0005,14:0.000125,16:0.00003125,18:0.0000078125} # Volts per count for each resolution
+AD_PGA=0.5 # PGA factor for a gain of x1, the same as the ABE library uses
+AD_Divider=2.471 # Scaling for the ADC Pi input voltage divider, the same as the ABE library uses
+
+# Volts for one raw count at Bits resolution
+def Volts_Per_Code(Bits):
+    return AD_LSB.get(Bits,AD_LSB[12])/AD_PGA*AD_Divider
+
+# Turn a batch of signed raw counts at Bits resolution into a list of volts. Negative readings
+# are shown as 0 volts, the same as the ABE library's read_voltage does.
+def Codes_To_Volts(Codes,Bits):
+    Scale=Volts_Per_Code(Bits)
+    if numpy is not None and len(Codes) > 0:
+        return (numpy.maximum(numpy.asarray(Codes,dtype=numpy.float64),0.0)*Scale).tolist()
+    return [(Code if Code > 0 else 0)*Scale for Code in Codes]
+
+# The Pi's i2c bus device, read and written a whole transfer at a time. In simulation mode
+# Sim_Hardware's Sim_I2C_Dev is used in its place.
+class I2C_Dev:
+    def __init__(self):
+        self.Fd=None
+        for Bus_Number in (1,0): # Newer Pis use i2c bus 1, the very first ones bus 0
+            try:
+                self.Fd=os.open("/dev/i2c-%d" % Bus_Number,os.O_RDWR)
+                break
+            except OSError:
+                pass
+        if self.Fd is None:
+            raise IOError("No i2c bus found")
+        self.Address=None # i2c address the device is currently pointed at
+
+    def Select(self,Address):
+        if Address != self.Address:
+            fcntl.ioctl(self.Fd,I2C_SLAVE,Address)
+            self.Address=Address
+
+    def Write(self,Data):
+        os.write(self.Fd,Data)
+
+    def Read(self,Count):
+        return os.read(self.Fd,Count)
+
+    def Close(self):
+        os.close(self.Fd)
+
+class MCP3424_Stream:
+    def __init__(self):
+        self.Dev=Sim_I2C_Dev() if Sim_Mode else I2C_Dev()
+        self.Chan={} # Channel and resolution each chip is configured for, by address
+
+    # Put the chip at Address into continuous conversion on Chan (1-8) at Bits resolution,
+    # unless it is already set up that way.
+    def Configure(self,Address,Chan,Bits):
+        if self.Chan.get(Address) == (Chan,Bits):
+            return
+        self.Dev.Select(Address)
+        self.Dev.Write(bytes((MCP_CONT | (((Chan-1) & 3) << 5) | MCP_Rate_Bits[Bits],)))
+        self.Chan[Address]=(Chan,Bits)
+
+    # Wait for the next new result from the chip at Address and return it as a signed count.
+    # Something else, such as an ADCPi set up by the GUI or the other reader, may have changed the
+    # chip's config behind our back. If no result comes for MCP_Wait conversion periods the chip
+    # is set up again, and if there is still none an IOError is raised.
+    def Read(self,Address):
+        Chan,Bits=self.Chan[Address]
+        Count=4 if Bits == 18 else 3 # Data bytes followed by the config byte
+        Chan_Bits=((Chan-1) & 3) << 5
+        self.Dev.Select(Address)
+        Tries=2
+        Give_Up=time.time()+MCP_Wait*MCP_Period[Bits]
+        while True:
+            Data=self.Dev.Read(Count)
+            # A result is only taken once it is new and is from the channel asked for
+            if not (Data[Count-1] & MCP_RDY) and (Data[Count-1] & 0x60) == Chan_Bits:
+                break
+            if time.time() > Give_Up:
+                Tries -= 1
+                if Tries == 0:
+                    raise IOError("No result from the A/D converter at 0x%02x" % Address)
+                del self.Chan[Address]
+                self.Configure(Address,Chan,Bits)
+                Give_Up=time.time()+MCP_Wait*MCP_Period[Bits]
+        if Bits == 18:
+            Code=((Data[0] & 0x03) << 16) | (Data[1] << 8) | Data[2]
+        else:
+            Code=(Data[0] << 8) | Data[1]
+            Code &= (1 << Bits)-1
+        if Code & (1 << (Bits-1)): # Negative. Extend the sign.
+            Code -= 1 << Bits
+        return Code
+
+    def Close(self):
+        self.Dev.Close()
+
+# Define the ADC reader portion, which will run as a separate process by itself.
+# Chip says which converter chip this reader looks after. 1 is the Adrs1 chip (channels 1-4) and
+# 2 is the Adrs2 chip (channels 5-8). When AD_Parallel_A is off the chip 1 reader reads every
+# channel and the chip 2 reader sits idle. When it is on each chip has its own reader, so the
+# two chips' conversion times overlap.
+# A reader with nothing to do (scope off, an A/D error pending, or no channels on its chip) sleeps
+# on Ctl_Cond until the GUI changes a setting, rather than going round the loop doing nothing.
+
+def ADC_Reader_A(Chip,Ctl,Ctl_Cond,Sample_Ring_A,Wake_Write_A):
     global adc
+    # Each reader opens its own i2c bus. The bus remembers which address it last talked to, so
+    # sharing one between processes would let them trip over each other.
+    My_Bus=i2c_helper.get_smbus()
+    My_Set=0
+    My_Seq=-1
+    My_Stream=None # MCP3424_Stream, opened the first time streaming mode is used
+    My_Stats=Sample_Ring_A.Stats
+    My_Read_Time=My_Stats.Read
+    My_Trig=Sample_Ring_A.Trig
+    Chan_Ptr=0
     while (True):
-        # Proceed in the scope is turned on and no A/D errors are pending
-        if ScopePower.value==1 and AD_Error_A.value==0:
-            My_Chan=ADchannel_A.value
-            if My_Chan <1 or My_Chan > 8: # Protect from receiving a bad channel
-                My_Chan=1
-            if AD_Set_A.value > 0: # Change the resolution and/or i2c address of the AD board
-                try:
-                    adc = ADCPi(bus, AD_Adrs1_A.value, AD_Adrs2_A.value, AD_Bits_A.value)
-                except IOError:
-                    AD_Error_A.value=1
-                AD_Set_A.value = 0
-        # This read is from an AB Electronics ADC Pi Plus - 8 channel  converter, but
-        # with a different AD converter, change this to the appropriate method
-            ADvalue_A.value=adc.read_voltage(My_Chan) # Read from the ADC channel
-            ReadTime_A.value=time.time() # Get a close time stamp of the read completion
+        My_Stats.Loops += 1
+        # Only go back to the control block for a full copy when something in it has changed
+        if Ctl.Seq != My_Seq:
+            Snap=Control_Read(Ctl)
+            My_Seq=Snap.Seq
+            # Scope channel "A" is always read. In multi-channel mode the extra channels are
+            # read in turn with it, one channel per pass. In parallel mode only the channels on
+            # this reader's chip are read.
+            Parallel=Snap.Parallel
+            My_Chans=[]
+            Chan_Set=Snap.Chan_Set[:]
+            Chan_Set[Snap.Chan]=1
+            for Chan in [Snap.Chan]+list(range(1,9)):
+                if Chan_Set[Chan] and Chan not in My_Chans:
+                    if not Parallel or (Chan < 5) == (Chip == 1):
+                        My_Chans.append(Chan)
+            if Chip == 2 and not Parallel:
+                My_Chans=[]
+            # Threshold trigger. Every reading of scope channel "A" is tested, as a raw count so
+            # there is no float math per reading. It triggers rising through the threshold.
+            Trig_Chan=Snap.Chan if Snap.Trig_Thresh else 0
+            Trig_Code=Snap.Trig_Volts/Volts_Per_Code(Snap.Bits)
+            Trig_Prev=None # Count of the last reading of Trig_Chan
+            # Boxcar averaging. Each channel's last Box_N counts are kept in a ring with their
+            # running sum, so each reading costs one add and one subtract whatever Box_N is. Until
+            # a channel has Box_N readings the ones it has are averaged.
+            Box_N=max(Snap.Boxcar,1)
+            Box_Codes=[[0]*Box_N for Chan in range(9)]
+            Box_Sum=[0]*9
+            Box_Fill=[0]*9
+            Box_Ptr=[0]*9
+        # Sleep until a setting changes if the scope is off, an A/D error is pending or there is
+        # nothing on this chip to read
+        if Snap.Power!=1 or Ctl.Error!=0 or not My_Chans:
+            with Ctl_Cond:
+                Ctl_Cond.wait_for(lambda: Ctl.Seq != My_Seq)
+            continue
+        if Snap.Set != My_Set: # Change the resolution and/or i2c address of the AD board
+            My_Set=Snap.Set
+            My_Adrs1=Snap.Adrs1
+            My_Adrs2=Snap.Adrs2
+            My_Bits=Snap.Bits
+            if My_Stream is not None: # ADCPi puts the chips back on channel 1 in one shot mode,
+                My_Stream.Chan={}     # so streaming will have to set them up again
+            try:
+                adc = ADCPi(My_Bus, My_Adrs1, My_Adrs2, My_Bits)
+            except IOError:
+                Ctl.Error=1
+                continue
+        Chan_Ptr += 1
+        if Chan_Ptr >= len(My_Chans):
+            Chan_Ptr=0
+        My_Chan=My_Chans[Chan_Ptr]
+        if My_Chan <1 or My_Chan > 8: # Protect from receiving a bad channel
+            My_Chan=1
+    # This read is from an AB Electronics ADC Pi Plus - 8 channel  converter, but
+    # with a different AD converter, change this to the appropriate method
+        Start_Time=time.time()
+        if Snap.Stream:
+            Address=My_Adrs1 if My_Chan < 5 else My_Adrs2
+            try:
+                if My_Stream is None:
+                    My_Stream=MCP3424_Stream()
+                My_Stream.Configure(Address,My_Chan,My_Bits)
+                Code=My_Stream.Read(Address)
+            except (IOError,OSError):
+                Ctl.Error=1
+                continue
+        else:
+            if My_Stream is not None: # The ABE library rewrites the config on every read,
+                My_Stream.Chan={}     # so streaming will have to set the chips up again
+            Code=adc.read_raw(My_Chan) # Read from the ADC channel
+            # The ABE library clears the sign bit of a negative count and keeps the sign to
+            # itself, so put the sign back. Otherwise noise just under 0 volts would show as
+            # readings near full scale.
+            if getattr(adc,"_ADCPi__signbit",False):
+                Code -= 1 << (My_Bits-1)
+        ReadTime=time.time() # Get a close time stamp of the read completion
+        My_Read_Time.Add((ReadTime-Start_Time)*1000000.0)
+        if Profile_Timeline is not None:
+            Profile_Timeline.append((Start_Time,ReadTime-Start_Time,My_Chan))
+        if Box_N > 1: # The reading is replaced by the rounded mean count, in integer math
+            Ptr=Box_Ptr[My_Chan]
+            Box_Sum[My_Chan] += Code-Box_Codes[My_Chan][Ptr]
+            Box_Codes[My_Chan][Ptr]=Code
+            Box_Ptr[My_Chan]=(Ptr+1)%Box_N
+            if Box_Fill[My_Chan] < Box_N:
+                Box_Fill[My_Chan] += 1
+            Code=(Box_Sum[My_Chan]+Box_Fill[My_Chan]//2)//Box_Fill[My_Chan]
+        Sample_Ring_A.Put(ReadTime,Code,My_Chan,My_Bits)
+        if My_Chan == Trig_Chan:
+            if Code >= Trig_Code and Trig_Prev is not None and Trig_Prev < Trig_Code:
+                Trig_Publish(My_Trig,ReadTime,Sample_Ring_A.Head.value-1)
+            Trig_Prev=Code
+        try:
+            os.write(Wake_Write_A,b'\0') # Tell the GUI there is something new to draw
+        except BlockingIOError:
+            pass
+
+# ADC_Reader_A under a profiler, used in profiling mode. The reader never returns. It is stopped
+# with SIGTERM when the GUI exits, so that is turned into an exit that lets the profile be saved.
+def Profiled_Reader(Chip,*Args):
+    Profiler=Profile_Start()
+    signal.signal(signal.SIGTERM,lambda Sig,Frame: sys.exit(0))
+    try:
+        Profiler.runcall(ADC_Reader_A,Chip,*Args)
+    finally:
+        Profile_Save(Profiler,"reader%d" % Chip)
+
+# Convert a batch of readings to trace pixel coordinates in one pass. Times and Volts are the
+# readings, StartTime is the time stamp of the first pixel of the trace and Volts_Prev is the
+# volts of the point just before the batch, which starts the first line. Returns the x and y
+# pixels, the color runs as [first reading, color] pairs, and LastLine, which is True when the
+# batch reached the end of the trace. The batch is cut off there. Lines under the threshold are
+# colored Color_Under.
+def Pixel_Transform(Times,Volts,StartTime,Volts_Prev,Color_Under="green"):
+    X0=Y_Lab_width
+    X_Max=pix_width
+    Y_Max=Y_Axis_Pixels
+    Xs_Per_Sec=Xscale
+    Ys_Per_Volt=Yscale
+    Thresh=Thresh_A
+    Thresh_Volts=Threshold_A
+    LastLine=False
+    if numpy is not None:
+        T=numpy.asarray(Times,dtype=numpy.float64)
+        V=numpy.asarray(Volts,dtype=numpy.float64)
+        Xs=numpy.rint((T-StartTime)*Xs_Per_Sec).astype(numpy.int32)+X0
+        Edge=numpy.flatnonzero(Xs >= X_Max)
+        if Edge.size > 0: # End of the trace. Stop at the right edge.
+            LastLine=True
+            Xs=Xs[:Edge[0]+1]
+            V=V[:Edge[0]+1]
+            Xs[-1]=X_Max
+        # Keep over and under voltage on the screen, then invert the y-axis location
+        # (0 is top pixel on a canvas)
+        Ys=Y_Max-numpy.clip(numpy.rint(V*Ys_Per_Volt),1,Y_Max).astype(numpy.int32)
+        if Thresh:
+            # A line is red if either end is at or over the threshold
+            Over=V >= Thresh_Volts
+            Hot=Over.copy()
+            Hot[0] |= Volts_Prev >= Thresh_Volts
+            Hot[1:] |= Over[:-1]
+            Starts=[0]+(numpy.flatnonzero(Hot[1:] != Hot[:-1])+1).tolist()
+            Runs=[[k,"red" if Hot[k] else Color_Under] for k in Starts]
+        else:
+            Runs=[[0,Color_Under]]
+        return Xs.tolist(),Ys.tolist(),Runs,LastLine
+
+    Xs=array('i')
+    Ys=array('i')
+    Runs=[]
+    Run_Color=""
+    Over_Prev=Thresh and Volts_Prev >= Thresh_Volts
+    for k in range(len(Times)):
+        x=round((Times[k]-StartTime)*Xs_Per_Sec)+X0
+        y=round(Volts[k]*Ys_Per_Volt)
+        if y < 1:
+            y = 1 # Keep over voltage on the screen (top of Y axis)
+        if y > Y_Max:
+            y = Y_Max # Keep under voltage on the screen (bottom of Y axis)
+        Over=Thresh and Volts[k] >= Thresh_Volts
+        Color="red" if (Over or Over_Prev) else Color_Under
+        if Color != Run_Color:
+            Runs.append([k,Color])
+            Run_Color=Color
+        Over_Prev=Over
+        Ys.append(Y_Max-y) # Invert y-axis location (0 is top pixel on a canvas)
+        if x >= X_Max: # End of the trace. Stop at the right edge.
+            Xs.append(X_Max)
+            LastLine=True
+            break
+        Xs.append(x)
+    return Xs,Ys,Runs,LastLine
+
+# Peak detect (min/max) decimation. When readings come in faster than the trace has pixel
+# columns, each column is cut down to its lowest and highest point, kept in the order they
+# happened. No more than two points per column reach the canvas however fast the converter is,
+# and short glitches stay visible. A column with a red line in it is drawn red. The last column
+# of a batch is held back until a reading lands in a later column, since more readings for it
+# may still be on the way.
+class MinMax_Decimator:
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.Col_X=None # x pixel of the column being held back
+        self.Col_Ys=[]
+        self.Col_Colors=[]
+
+    # Takes Xs,Ys,Runs as returned by Pixel_Transform and returns them decimated, ready for
+    # Trace.Draw_Lines. If LastLine is True the held back column is let go as well.
+    def Decimate(self,Xs,Ys,Runs,LastLine):
+        Out_Xs=[]
+        Out_Ys=[]
+        Out_Runs=[]
+        Run_Ptr=0
+        Color=Runs[0][1] if Runs else ""
+        for k in range(len(Xs)):
+            while Run_Ptr < len(Runs) and Runs[Run_Ptr][0] <= k:
+                Color=Runs[Run_Ptr][1]
+                Run_Ptr += 1
+            if Xs[k] != self.Col_X:
+                self.Emit_Column(Out_Xs,Out_Ys,Out_Runs)
+                self.Col_X=Xs[k]
+            self.Col_Ys.append(Ys[k])
+            self.Col_Colors.append(Color)
+        if LastLine:
+            self.Emit_Column(Out_Xs,Out_Ys,Out_Runs)
+            self.Reset()
+        return Out_Xs,Out_Ys,Out_Runs
+
+    def Emit_Column(self,Out_Xs,Out_Ys,Out_Runs):
+        Ys=self.Col_Ys
+        Colors=self.Col_Colors
+        if len(Ys) > 2:
+            Lo=Ys.index(min(Ys))
+            Hi=Ys.index(max(Ys))
+            if Lo > Hi:
+                Lo,Hi=Hi,Lo
+            Color="red" if "red" in Colors else Colors[0]
+            if Lo == Hi: # Flat column
+                Ys=[Ys[Lo]]
+                Colors=[Color]
+            else:
+                Ys=[Ys[Lo],Ys[Hi]]
+                Colors=[Color,Color]
+        for k in range(len(Ys)):
+            if not Out_Runs or Out_Runs[-1][1] != Colors[k]:
+                Out_Runs.append([len(Out_Xs),Colors[k]])
+            Out_Xs.append(self.Col_X)
+            Out_Ys.append(Ys[k])
+        self.Col_Ys=[]
+        self.Col_Colors=[]
+
+# Split a batch of readings up by A/D channel. Returns a dictionary of (Times,Volts) for each
+# channel in the batch, with the readings still in time order.
+def Split_Channels(Times,Volts,Chans):
+    if Chans.count(Chans[0]) == len(Chans): # Single channel. Nothing to split.
+        return {Chans[0]:(Times,Volts)}
+    Split={}
+    if numpy is not None:
+        C=numpy.asarray(Chans)
+        T=numpy.asarray(Times)
+        V=numpy.asarray(Volts)
+        for Chan in numpy.unique(C).tolist():
+            Mask=(C == Chan)
+            Split[Chan]=(T[Mask],V[Mask])
+        return Split
+    for k in range(len(Chans)):
+        if Chans[k] not in Split:
+            Split[Chans[k]]=([],[])
+        Split[Chans[k]][0].append(Times[k])
+        Split[Chans[k]][1].append(Volts[k])
+    return Split
+
+# The trace of one A/D channel on the Trace canvas. The trace is drawn as a few multi-point
+# lines (runs) rather than one canvas line per segment. A new run is only started when the line
+# color changes, and the run being extended gets all its points in one coords call by Show.
+# Run items are kept and reused from one trace to the next.
+class Chan_Trace:
+    def __init__(self,Screen,Color):
+        self.Screen=Screen
+        self.Color=Color # Color of lines under the threshold
+        self.Run_Items=[] # Canvas line IDs of the runs
+        self.Run_Ptr=-1 # Index of the run being extended
+        self.Run_Points=[] # x,y pixel pairs of the run being extended
+        self.Decimator=MinMax_Decimator()
+        self.Clear()
+
+    # Blank out the trace and wait for the first reading of a new one
+    def Clear(self):
+        for ii in range(self.Run_Ptr+1):
+            self.Screen.coords(self.Run_Items[ii],0,0,0,0)
+        Scope_Stats.Canvas_Calls += self.Run_Ptr+1
+        self.Run_Ptr=-1
+        self.Run_Color=""
+        self.Run_Points=[]
+        self.Run_Dirty=False # Run_Points has points not yet sent to the canvas
+        self.Decimator.Reset()
+        self.FirstPoint=True
+        self.Last_X=0 # End point of the last line drawn
+        self.Last_Y=0
+        self.Last_Volts=0.0 # Volts of the last reading, in case threshold check is on
+
+    # Add a batch of readings for this channel to the trace. Returns LastLine, which is True when
+    # the end of the trace was reached, and the number of readings used.
+    def Add_Readings(self,Times,Volts):
+        Used=0
+        if self.FirstPoint:
+            # The first reading only sets the start point of the first line. The first point of
+            # the trace sits just right of the y axis.
+            Xs,Ys,Runs,LastLine=Pixel_Transform(Times[:1],Volts[:1],TraceStartTime,Volts[0])
+            self.Last_X=max(Xs[0],Y_Lab_width+1)
+            self.Last_Y=Ys[0]
+            self.Last_Volts=Volts[0]
+            self.FirstPoint=False
+            Times=Times[1:]
+            Volts=Volts[1:]
+            Used=1
+            if len(Times) == 0:
+                return False,Used
+        Xs,Ys,Runs,LastLine=Pixel_Transform(Times,Volts,TraceStartTime,self.Last_Volts,self.Color)
+        Used += len(Xs)
+        self.Last_Volts=Volts[len(Xs)-1]
+        # Never more than two points per pixel column go on to the canvas
+        Xs,Ys,Runs=self.Decimator.Decimate(Xs,Ys,Runs,LastLine)
+        if Xs:
+            if Scope_Persist is not None:
+                Scope_Persist.Add_Lines(self.Last_X,self.Last_Y,Xs,Ys)
+            self.Draw_Lines(Xs,Ys,Runs)
+        if LastLine:
+            self.Show()
+        return LastLine,Used
+
+    # Add a batch of lines to the trace. The first line starts at the end of the last line drawn
+    # and each line ends at the next Xs,Ys point. Runs gives the color of the lines as
+    # [first point, color] pairs, as returned by Pixel_Transform.
+    def Draw_Lines(self,Xs,Ys,Runs):
+        for r in range(len(Runs)):
+            First,ThisColor=Runs[r]
+            if r+1 < len(Runs):
+                End=Runs[r+1][0]
+            else:
+                End=len(Xs)
+            if ThisColor != self.Run_Color or not self.Run_Points:
+                self.Show() # Finish off the current run and start a new one at the last point
+                self.Run_Ptr += 1
+                if self.Run_Ptr >= len(self.Run_Items):
+                    self.Run_Items.append(self.Screen.create_line(0,0,0,0,fill=ThisColor))
+                else:
+                    self.Screen.itemconfig(self.Run_Items[self.Run_Ptr],fill=ThisColor)
+                Scope_Stats.Canvas_Calls += 1
+                self.Run_Color=ThisColor
+                self.Run_Points=[self.Last_X,self.Last_Y]
+            Points=[0]*(2*(End-First))
+            Points[0::2]=Xs[First:End]
+            Points[1::2]=Ys[First:End]
+            self.Run_Points.extend(Points)
+            self.Last_X=Xs[End-1]
+            self.Last_Y=Ys[End-1]
+        self.Run_Dirty=True
+
+    # Send the points of the run being extended to the canvas in a single call. This is called
+    # once after each batch of new lines, not once per line.
+    def Show(self):
+        if self.Run_Dirty:
+            self.Screen.coords(self.Run_Items[self.Run_Ptr],self.Run_Points)
+            Scope_Stats.Canvas_Calls += 1
+            self.Run_Dirty=False
+
+# Persistence mode. Every sweep drawn is also added into a hit count for each pixel of the trace
+# area, kept as 16 bit counts in one compact array. When a sweep ends the counts are turned into
+# colors, dim blue for a pixel hit once up to red for the most hit, and the whole area is shown
+# as a single PhotoImage under the live trace. So rare glitches stay on the screen over any number
+# of sweeps for the cost of one image a sweep, rather than thousands of canvas lines. Each sweep
+# the old counts are multiplied by Persist_Decay first, so with a decay under 1.0 old sweeps fade
+# away. At 1.0 persistence is infinite.
+# The lines of a sweep are first cut down to the span of pixel rows they cross in each column.
+# At the end of the sweep every pixel in those spans gets Persist_Hit more counts. Counting in
+# sixteenths of a hit lets decay fade a pixel gradually, and the counts stop at 65535.
+Persist_Decay=1.0
+Persist_Hit=16
+
+# Colors for the 256 brightness levels of the persistence image, graded between these
+Persist_Stops=[(0,(0,0,0)),(1,(0,0,110)),(64,(0,110,255)),(128,(0,230,0)),(192,(255,230,0)),(255,(255,0,0))]
+Persist_Palette=[]
+for Stop in range(len(Persist_Stops)-1):
+    Level_A,Color_A=Persist_Stops[Stop]
+    Level_B,Color_B=Persist_Stops[Stop+1]
+    for Level in range(Level_A,Level_B):
+        Persist_Palette.append(tuple(int(Color_A[n]+(Color_B[n]-Color_A[n])*(Level-Level_A)/(Level_B-Level_A))
+                                     for n in range(3)))
+Persist_Palette.append(Persist_Stops[-1][1])
+
+# Turn rows of 8 bit RGB pixels into PPM image data, which a PhotoImage takes directly
+def Ppm_Data(Width,Height,Pixels):
+    return b"P6 %d %d 255\n" % (Width,Height)+bytes(Pixels)
+
+# The pixels lines joining (X0,Y0) and each Xs,Ys point in turn cross, as (x, top y, bottom y)
+# for each column of each line. Each column gets the rows the line crosses within half a pixel
+# either side of it, so steep lines have no gaps.
+def Column_Spans(X0,Y0,Xs,Ys):
+    Spans=[]
+    for k in range(len(Xs)):
+        X1=Xs[k]
+        Y1=Ys[k]
+        if X1 == X0:
+            Spans.append((X0,min(Y0,Y1),max(Y0,Y1)))
+        else:
+            Slope=(Y1-Y0)/(X1-X0)
+            for X in range(X0,X1+1):
+                Ya=Y0+Slope*(max(X-0.5,X0)-X0)
+                Yb=Y0+Slope*(min(X+0.5,X1)-X0)
+                Spans.append((X,int(round(min(Ya,Yb))),int(round(max(Ya,Yb)))))
+        X0=X1
+        Y0=Y1
+    return Spans
+
+class Persistence:
+    def __init__(self,Graph):
+        self.Screen=Graph.Screen
+        self.Raster=Graph.Raster # With the raster renderer the image is its background instead
+        self.Width=X_Axis_Pixels+1 # Trace x pixels Y_Lab_width to pix_width
+        self.Height=Y_Axis_Pixels
+        if self.Raster is None:
+            self.Image=PhotoImage(width=self.Width,height=self.Height)
+            self.Item=self.Screen.create_image(Y_Lab_width,0,image=self.Image,anchor=NW)
+            self.Screen.tag_lower(self.Item) # Under the axes and the live trace
+        if numpy is not None:
+            self.Palette=numpy.array(Persist_Palette,dtype=numpy.uint8)
+        else:
+            self.Palette=[bytes(Color[n] for Color in Persist_Palette) for n in range(3)]
+        self.Clear()
+
+    def Clear(self):
+        if numpy is not None:
+            self.Hits=numpy.zeros((self.Height,self.Width),dtype=numpy.uint16)
+        else:
+            self.Hits=array('H',bytes(2*self.Width*self.Height))
+        self.Sweeps=0
+        self.New_Sweep()
+        self.Render()
+
+    def New_Sweep(self):
+        self.Lo=[self.Height]*self.Width # Span of rows this sweep crossed in each column
+        self.Hi=[-1]*self.Width
+
+    # Add lines joining (X0,Y0) and each Xs,Ys point in turn, as Chan_Trace.Draw_Lines draws them
+    def Add_Lines(self,X0,Y0,Xs,Ys):
+        Lo=self.Lo
+        Hi=self.Hi
+        Last_Col=self.Width-1
+        for X,Top,Bottom in Column_Spans(X0,Y0,Xs,Ys):
+            Col=min(max(X-Y_Lab_width,0),Last_Col)
+            if Top < Lo[Col]:
+                Lo[Col]=max(Top,0)
+            if Bottom > Hi[Col]:
+                Hi[Col]=min(Bottom,self.Height-1)
+
+    # The sweep is over. Fade the old counts, add in the sweep and show the result.
+    def Sweep_Done(self):
+        Cols=[Col for Col in range(self.Width) if self.Hi[Col] >= 0]
+        if not Cols:
+            return
+        Decay=Persist_Decay
+        if numpy is not None:
+            Hits=self.Hits.astype(numpy.int32)
+            if Decay < 1.0:
+                Hits=(Hits*Decay).astype(numpy.int32)
+            # Mark where each column's span starts and ends, and add them up down the columns
+            Marks=numpy.zeros((self.Height+1,self.Width),dtype=numpy.int32)
+            Lo=numpy.array([self.Lo[Col] for Col in Cols])
+            Hi=numpy.array([self.Hi[Col] for Col in Cols])
+            Marks[Lo,Cols]=Persist_Hit
+            Marks[Hi+1,Cols]=-Persist_Hit
+            Hits += numpy.cumsum(Marks[:self.Height],axis=0)
+            self.Hits=numpy.minimum(Hits,65535).astype(numpy.uint16)
+        else:
+            Hits=self.Hits
+            if Decay < 1.0:
+                Hits=array('H',[int(Count*Decay) for Count in Hits])
+            for Col in Cols:
+                for Row in range(self.Lo[Col],self.Hi[Col]+1):
+                    k=Row*self.Width+Col
+                    Hits[k]=min(Hits[k]+Persist_Hit,65535)
+            self.Hits=Hits
+        self.Sweeps += 1
+        self.New_Sweep()
+        self.Render()
+
+    # Show the counts. Brightness goes with the log of the count, so a pixel hit once is still
+    # plain to see next to one hit on every sweep.
+    def Render(self):
+        if numpy is not None:
+            Top=int(self.Hits.max())
+            Scale=223.0/math.log(Top) if Top > 1 else 0.0
+            Counts=numpy.maximum(self.Hits,1).astype(numpy.float32)
+            Levels=numpy.where(self.Hits > 0,32.0+numpy.log(Counts)*Scale,0.0).astype(numpy.uint8)
+            Pixels=self.Palette[Levels]
+        else:
+            Top=max(self.Hits)
+            Scale=223.0/math.log(Top) if Top > 1 else 0.0
+            Levels=bytes([int(32.0+math.log(Count)*Scale) if Count else 0 for Count in self.Hits])
+            Pixels=bytearray(3*len(Levels))
+            for n in range(3):
+                Pixels[n::3]=Levels.translate(self.Palette[n])
+        if self.Raster is not None: # Shown from the next trace on
+            self.Raster.Background=Pixels
+            return
+        self.Image.configure(data=Ppm_Data(self.Width,self.Height,Pixels),format="PPM")
+        Scope_Stats.Canvas_Calls += 1
+
+    def Close(self):
+        if self.Raster is not None:
+            self.Raster.Background=None
+        else:
+            self.Screen.delete(self.Item)
+
+Scope_Persist=None # The Persistence while persistence mode is on
+
+# Sweep averaging. The trace shows each reading as the mean of all the readings that fell in its
+# pixel column over the last Average_Sweeps sweeps, including this one. Sweeps are lined up on
+# the trace start time, which on a triggered sweep is set by the trigger, so averaging a repeating
+# signal on a trigger takes the noise out of it. Each sweep's per column sums and counts are kept
+# in preallocated rows, one row per sweep averaged, along with the running totals over all of
+# them. A reading adds into its column's row and totals. A new sweep takes the oldest row off the
+# totals and starts again in it, so nothing is ever summed over all the sweeps again.
+Average_Sweeps=1 # Sweeps averaged. 1 is no averaging.
+
+class Sweep_Average:
+    def __init__(self,Sweeps):
+        self.Sweeps=Sweeps
+        self.Width=X_Axis_Pixels+1 # Trace x pixels Y_Lab_width to pix_width
+        self.Chans={} # Channel: [Sums,Counts,Row_Sums,Row_Counts]
+        self.Row=0 # Row of the sweep being drawn
+
+    def Chan_Rows(self,Chan):
+        if Chan not in self.Chans:
+            if numpy is not None:
+                self.Chans[Chan]=[numpy.zeros(self.Width),numpy.zeros(self.Width),
+                                  numpy.zeros((self.Sweeps,self.Width)),numpy.zeros((self.Sweeps,self.Width))]
+            else:
+                self.Chans[Chan]=[array('d',bytes(8*self.Width)),array('d',bytes(8*self.Width)),
+                                  [array('d',bytes(8*self.Width)) for Row in range(self.Sweeps)],
+                                  [array('d',bytes(8*self.Width)) for Row in range(self.Sweeps)]]
+        return self.Chans[Chan]
+
+    # Start over, as after an X scale change, when the old columns no longer line up
+    def Clear(self):
+        self.Chans={}
+
+    # The oldest sweep drops out of the average and its row is used for the new one
+    def New_Sweep(self):
+        self.Row=(self.Row+1)%self.Sweeps
+        for Chan in self.Chans:
+            Sums,Counts,Row_Sums,Row_Counts=self.Chans[Chan]
+            if numpy is not None:
+                Sums -= Row_Sums[self.Row]
+                Counts -= Row_Counts[self.Row]
+                Row_Sums[self.Row]=0.0
+                Row_Counts[self.Row]=0.0
+            else:
+                Old_Sums=Row_Sums[self.Row]
+                Old_Counts=Row_Counts[self.Row]
+                for Col in range(self.Width):
+                    if Old_Counts[Col]:
+                        Sums[Col] -= Old_Sums[Col]
+                        Counts[Col] -= Old_Counts[Col]
+                        Old_Sums[Col]=0.0
+                        Old_Counts[Col]=0.0
+
+    # Add a batch of readings from one channel of the current sweep, StartTime being the time of
+    # its first pixel. Returns the averaged volts to draw in their place. Readings off the end of
+    # the trace are left as they are.
+    def Add(self,Chan,Times,Volts,StartTime):
+        Sums,Counts,Row_Sums,Row_Counts=self.Chan_Rows(Chan)
+        if numpy is not None:
+            V=numpy.array(Volts,dtype=numpy.float64)
+            Cols=numpy.rint((numpy.asarray(Times,dtype=numpy.float64)-StartTime)*Xscale).astype(numpy.int64)
+            On=(Cols >= 0) & (Cols < self.Width)
+            Cols=Cols[On]
+            numpy.add.at(Row_Sums[self.Row],Cols,V[On])
+            numpy.add.at(Row_Counts[self.Row],Cols,1.0)
+            numpy.add.at(Sums,Cols,V[On])
+            numpy.add.at(Counts,Cols,1.0)
+            V[On]=Sums[Cols]/Counts[Cols]
+            return V
+        Row_Sum=Row_Sums[self.Row]
+        Row_Count=Row_Counts[self.Row]
+        Averaged=list(Volts)
+        for k in range(len(Averaged)):
+            Col=int(round((Times[k]-StartTime)*Xscale))
+            if 0 <= Col < self.Width:
+                Row_Sum[Col] += Averaged[k]
+                Row_Count[Col] += 1.0
+                Sums[Col] += Averaged[k]
+                Counts[Col] += 1.0
+                Averaged[k]=Sums[Col]/Counts[Col]
+        return Averaged
+
+Scope_Average=None # The Sweep_Average while more than one sweep is averaged
+
+# Raster renderer. Started with --render=raster (or SCOPE_RENDER=raster in the environment) the
+# trace is drawn into a pixel buffer of its own instead of as canvas line items, and the buffer is
+# shown as one PhotoImage. Only the columns drawn in since the last screen update are sent to it,
+# as a strip of PPM data, so the cost of an update depends on how much of the screen changed, not
+# on how many readings or line items there are, and the canvas never holds more than the one
+# image. With NumPy the lines are drawn a whole batch at a time. The default is --render=canvas.
+# Roll mode always draws on the canvas.
+Render_Mode = Option("--render","SCOPE_RENDER","canvas")
+
+# RGB of the trace colors
+Raster_Colors={"green":(0,255,0),"red":(255,0,0),"cyan":(0,255,255),"magenta":(255,0,255),
+               "orange":(255,165,0),"white":(255,255,255),"deep sky blue":(0,191,255),
+               "pink":(255,192,203),"gold":(255,215,0),"violet":(238,130,238)}
+
+class Raster_Screen:
+    def __init__(self,Screen):
+        self.Screen=Screen
+        self.Width=X_Axis_Pixels+1 # Trace x pixels Y_Lab_width to pix_width
+        self.Height=Y_Axis_Pixels
+        self.Image=PhotoImage(width=self.Width,height=self.Height)
+        self.Item=Screen.create_image(Y_Lab_width,0,image=self.Image,anchor=NW)
+        Screen.tag_lower(self.Item) # Under the axes
+        self.Background=None # Pixels each trace starts from, set by Persistence. None is black.
+        self.Clear()
+
+    # Start a new trace
+    def Clear(self):
+        if self.Background is None:
+            if numpy is not None:
+                self.Pixels=numpy.zeros((self.Height,self.Width,3),dtype=numpy.uint8)
+            else:
+                self.Pixels=bytearray(3*self.Width*self.Height)
+            self.Image.blank()
+        else:
+            if numpy is not None:
+                self.Pixels=numpy.array(self.Background,dtype=numpy.uint8)
+            else:
+                self.Pixels=bytearray(self.Background)
+            self.Image.configure(data=Ppm_Data(self.Width,self.Height,self.Pixels),format="PPM")
+        Scope_Stats.Canvas_Calls += 1
+        self.Dirty_Lo=self.Width # Columns drawn in since the last Show
+        self.Dirty_Hi=-1
+
+    # Draw lines joining (X0,Y0) and each Xs,Ys point in turn, colored by Runs as Chan_Trace.Draw_Lines
+    def Lines(self,X0,Y0,Xs,Ys,Runs):
+        if numpy is not None:
+            self.Numpy_Lines(X0,Y0,Xs,Ys,Runs)
+            return
+        for r in range(len(Runs)):
+            First,Color=Runs[r]
+            End=Runs[r+1][0] if r+1 < len(Runs) else len(Xs)
+            RGB=bytes(Raster_Colors.get(Color,(255,255,255)))
+            Start_X,Start_Y=(X0,Y0) if First == 0 else (Xs[First-1],Ys[First-1])
+            for X,Top,Bottom in Column_Spans(Start_X,Start_Y,Xs[First:End],Ys[First:End]):
+                Col=min(max(X-Y_Lab_width,0),self.Width-1)
+                for Row in range(max(Top,0),min(Bottom,self.Height-1)+1):
+                    k=3*(Row*self.Width+Col)
+                    self.Pixels[k:k+3]=RGB
+                self.Dirty_Lo=min(self.Dirty_Lo,Col)
+                self.Dirty_Hi=max(self.Dirty_Hi,Col)
+
+    # Lines as above, every line of the batch at once. Each line is cut into one span of rows for
+    # each column it crosses, as Column_Spans does, and then every span into its pixels.
+    def Numpy_Lines(self,X0,Y0,Xs,Ys,Runs):
+        X=numpy.array([X0]+list(Xs),dtype=numpy.int64)-Y_Lab_width
+        Y=numpy.array([Y0]+list(Ys),dtype=numpy.float64)
+        Xa=X[:-1]
+        Xb=numpy.maximum(X[1:],Xa)
+        Ya=Y[:-1]
+        Yb=Y[1:]
+        Starts=[Run[0] for Run in Runs]
+        Colors=numpy.array([Raster_Colors.get(Run[1],(255,255,255)) for Run in Runs],dtype=numpy.uint8)
+        Line_Color=numpy.repeat(numpy.arange(len(Runs)),numpy.diff(Starts+[len(Xs)]))
+        # One entry per column of each line
+        Cols_Per=Xb-Xa+1
+        Line=numpy.repeat(numpy.arange(len(Xa)),Cols_Per)
+        Col=Xa[Line]+numpy.arange(len(Line))-numpy.repeat(numpy.cumsum(Cols_Per)-Cols_Per,Cols_Per)
+        Run_X=numpy.maximum(Xb-Xa,1)
+        Slope=numpy.where(Xb > Xa,(Yb-Ya)/Run_X,0.0)[Line]
+        Left=numpy.maximum(Col-0.5,Xa[Line])-Xa[Line]
+        Right=numpy.minimum(Col+0.5,Xb[Line])-Xa[Line]
+        Y_Left=numpy.where(Xb[Line] > Xa[Line],Ya[Line]+Slope*Left,Ya[Line])
+        Y_Right=numpy.where(Xb[Line] > Xa[Line],Ya[Line]+Slope*Right,Yb[Line])
+        Top=numpy.maximum(numpy.rint(numpy.minimum(Y_Left,Y_Right)),0).astype(numpy.int64)
+        Bottom=numpy.minimum(numpy.rint(numpy.maximum(Y_Left,Y_Right)),self.Height-1).astype(numpy.int64)
+        Col=numpy.clip(Col,0,self.Width-1)
+        # One entry per pixel of each span. Spans off the top or bottom of the screen have none.
+        Rows_Per=numpy.maximum(Bottom-Top+1,0)
+        Span=numpy.repeat(numpy.arange(len(Top)),Rows_Per)
+        Row=Top[Span]+numpy.arange(len(Span))-numpy.repeat(numpy.cumsum(Rows_Per)-Rows_Per,Rows_Per)
+        self.Pixels[Row,Col[Span]]=Colors[Line_Color[Line[Span]]]
+        self.Dirty_Lo=min(self.Dirty_Lo,int(Col.min()))
+        self.Dirty_Hi=max(self.Dirty_Hi,int(Col.max()))
+
+    # Send the columns drawn in since the last call to the screen, as one strip of PPM data
+    def Show(self):
+        if self.Dirty_Hi < self.Dirty_Lo:
+            return
+        Lo=self.Dirty_Lo
+        Hi=self.Dirty_Hi+1
+        if numpy is not None:
+            Strip=self.Pixels[:,Lo:Hi].tobytes()
+        else:
+            Row_Bytes=3*self.Width
+            Strip=b"".join(self.Pixels[Row*Row_Bytes+3*Lo:Row*Row_Bytes+3*Hi] for Row in range(self.Height))
+        self.Image.put(Ppm_Data(Hi-Lo,self.Height,Strip),to=(Lo,0))
+        Scope_Stats.Canvas_Calls += 1
+        self.Dirty_Lo=self.Width
+        self.Dirty_Hi=-1
+
+    def Close(self):
+        self.Screen.delete(self.Item)
+
+# Chan_Trace for the raster renderer. The readings go through the same pixel transform and
+# decimation, but the lines are drawn into the Raster_Screen, which Trace.Show_Trace puts on the
+# screen once for all channels.
+class Raster_Trace(Chan_Trace):
+    def __init__(self,Raster,Color):
+        self.Raster=Raster
+        super(Raster_Trace,self).__init__(Raster.Screen,Color)
+
+    def Draw_Lines(self,Xs,Ys,Runs):
+        self.Raster.Lines(self.Last_X,self.Last_Y,Xs,Ys,Runs)
+        self.Last_X=Xs[-1]
+        self.Last_Y=Ys[-1]
+
+    def Show(self):
+        pass
+
+# Roll (strip chart) mode. New readings come in at the right edge and everything already drawn
+# scrolls left. Nothing drawn is ever redrawn. The trace is a chain of short line segments, each
+# a canvas item tagged "roll", and scrolling is one canvas move of the tag. Only the segment
+# being added to gets its coordinates sent again. Segments that scroll off the left edge are
+# parked and used again at the right, so the number of canvas items, and the work per update,
+# stays the same however long the window is. Points are kept in roll pixels: pixels counted
+# from the first reading of the roll, which never change as the trace scrolls.
+Roll_Scale=60.0 # In roll mode the X scale buttons are minutes, not seconds
+Roll_Seg_Px=16 # Pixels of trace in each segment
+
+class Roll_Trace:
+    def __init__(self,Screen,Color):
+        self.Screen=Screen
+        self.Color=Color # Color of lines under the threshold
+        self.Segments=collections.deque() # [canvas line ID, roll points] of finished segments, oldest first
+        self.Free=[] # Parked canvas line IDs
+        self.Item=None # Canvas line ID of the segment being added to
+        self.Decimator=MinMax_Decimator()
+        self.Clear()
+
+    # Park every segment and start again
+    def Clear(self):
+        for Segment in self.Segments:
+            self.Park(Segment[0])
+        self.Segments.clear()
+        if self.Item is not None:
+            self.Park(self.Item)
+        self.Item=None
+        self.Seg_Color=""
+        self.Points=[] # Roll x,y pixel pairs of the segment being added to
+        self.Dirty=False # Points has points not yet sent to the canvas
+        self.Decimator.Reset()
+        self.Last_Volts=0.0
+
+    def Park(self,Item):
+        self.Screen.coords(Item,0,0,0,0)
+        Scope_Stats.Canvas_Calls += 1
+        self.Free.append(Item)
+
+    # Add a batch of readings for this channel. StartTime is the time stamp at the left edge of
+    # the trace and Offset turns trace x pixels into roll pixels. Returns the readings used.
+    def Add_Readings(self,Times,Volts,StartTime,Offset):
+        Xs,Ys,Runs,LastLine=Pixel_Transform(Times,Volts,StartTime,self.Last_Volts,self.Color)
+        self.Last_Volts=Volts[len(Xs)-1]
+        Xs,Ys,Runs=self.Decimator.Decimate([X+Offset for X in Xs],Ys,Runs,False)
+        for r in range(len(Runs)):
+            First,ThisColor=Runs[r]
+            End=Runs[r+1][0] if r+1 < len(Runs) else len(Xs)
+            for k in range(First,End):
+                if ThisColor != self.Seg_Color or self.Item is None or \
+                   (len(self.Points) > 2 and Xs[k]-self.Points[0] > Roll_Seg_Px):
+                    self.New_Segment(ThisColor)
+                self.Points.append(Xs[k])
+                self.Points.append(Ys[k])
+        self.Dirty=self.Dirty or len(Xs) > 0
+        return len(Times)
+
+    # Finish the segment being added to and start a new one from its last point
+    def New_Segment(self,Color):
+        if self.Item is not None:
+            self.Segments.append([self.Item,self.Points])
+        if self.Free:
+            self.Item=self.Free.pop()
+            self.Screen.itemconfig(self.Item,fill=Color)
+        else:
+            self.Item=self.Screen.create_line(0,0,0,0,fill=Color,tags="roll")
+        Scope_Stats.Canvas_Calls += 1
+        self.Seg_Color=Color
+        self.Points=self.Points[-2:]
+
+    # Send the segment being added to to the canvas, less any part left of Left, and park or
+    # trim finished segments that have scrolled off the left edge. Offset is as Add_Readings.
+    def Show(self,Offset,Left):
+        while self.Segments and self.Segments[0][1][-2] < Left:
+            self.Park(self.Segments.popleft()[0])
+        if self.Segments and self.Segments[0][1][0] < Left:
+            self.Segments[0][1]=self.Send(self.Segments[0][0],self.Segments[0][1],Offset,Left)
+        if self.Dirty or (self.Points and self.Points[0] < Left):
+            self.Points=self.Send(self.Item,self.Points,Offset,Left)
+            self.Dirty=False
+
+    # Set the coordinates of a segment's canvas line to its roll points from Left on. Returns
+    # the points kept.
+    def Send(self,Item,Points,Offset,Left):
+        k=0
+        while k < len(Points)-2 and Points[k] < Left:
+            k += 2
+        Points=Points[k:]
+        Coords=Points[:]
+        Coords[0::2]=[X-Offset for X in Points[0::2]]
+        if len(Coords) < 4: # A line needs two points
+            Coords=Coords+Coords
+        self.Screen.coords(Item,Coords)
+        Scope_Stats.Canvas_Calls += 1
+        return Points
 
 # Set up the graphic area where the trace is displayed
 class Trace(Frame):
@@ -382,15 +2239,27 @@ class Trace(Frame):
         X_Axis_Name=self.Screen.create_text((pix_width/2)+(Y_Lab_width/2),pix_height-8,
                                             text="SECONDS",fill="yellow")
         
-        self.Lines=[]
-        # Create huge line array. More than the number of pixels wide would be nice.
-        # We will be changing their position and color later when data is plotted.
-        # NOTE: A very fast Pi and very fast AD converter will chew these up fast, so
-        # more may be needed if that is the case.
-        for i in range(Max_Lines):
-            self.Lines.append(self.Screen.create_line(0,0,0,0,fill="black"))
+        self.Chan_Traces={} # Chan_Trace of each A/D channel drawn so far, made as needed
+        self.Raster=None # Raster_Screen, with the raster renderer
+        self.Roll_Traces={} # Roll_Trace of each A/D channel rolled so far, made as needed
+        self.Roll_Origin=None # Time stamp of roll pixel 0
+        self.Roll_Px=0 # Roll pixel at the right edge of the trace
         self.Five_Volt_Y() #Default. Put ticks and labels on Y axis
         self.One_Second_XD() #Default. Put ticks and labels on X axis
+        self.Set_Render(Render_Mode)
+
+    # Draw traces with the canvas or raster renderer from now on. Used at start up, and by
+    # Bench_Scope.py to compare the two.
+    def Set_Render(self,Mode):
+        for Chan in self.Chan_Traces:
+            for Item in self.Chan_Traces[Chan].Run_Items:
+                self.Screen.delete(Item)
+        self.Chan_Traces={}
+        if self.Raster is not None:
+            self.Raster.Close()
+            self.Raster=None
+        if Mode == "raster":
+            self.Raster=Raster_Screen(self.Screen)
 
     # Set up the Y axis ticks and labels for a 5 volt range, 1 volt per tick. As of this
     # writing, since the A/D converter is only 0-5v, for now this is the only y needed.
@@ -513,104 +2382,117 @@ class Trace(Frame):
         self.Screen.itemconfig(self.X_Label_3,text="3.0",fill="yellow")
         self.Screen.itemconfig(self.X_Label_4,text="4.0",fill="yellow")
 
+    # Label the X axis for any number of seconds. Playback can zoom out well past the X scale
+    # buttons.
+    def Span_X(self,Span):
+        X_Labels=(self.X_Label_1,self.X_Label_2,self.X_Label_3,self.X_Label_4)
+        for n in range(4):
+            self.Screen.itemconfig(X_Labels[n],text="%g" % (Span*(n+1)/4.0),fill="yellow")
+
+    # Label the X axis for roll mode, Span seconds back to now at the right edge
+    def Roll_X(self,Span):
+        X_Labels=(self.X_Label_0,self.X_Label_1,self.X_Label_2,self.X_Label_3,self.X_Label_4)
+        for n in range(5):
+            self.Screen.itemconfig(X_Labels[n],text="%g" % (-Span*(4-n)/4.0),fill="yellow")
+
+    # Start (or restart, on a new X scale) roll mode. The X scale is in minutes.
+    def Roll_Start(self):
+        global Xscale
+        self.New_Trace() # Blank out any sweep
+        for Chan in self.Roll_Traces:
+            self.Roll_Traces[Chan].Clear()
+            self.Roll_Traces[Chan].Color=self.Chan_Color(Chan)
+        self.Roll_Origin=None
+        self.Roll_Px=0
+        Span=xScale_time*Roll_Scale
+        Xscale=X_Axis_Pixels/Span
+        self.Roll_X(Span)
+
+    # Back to sweeps from roll mode
+    def Roll_Stop(self):
+        global Xscale
+        for Chan in self.Roll_Traces:
+            self.Roll_Traces[Chan].Clear()
+        Xscale=X_Axis_Pixels/xScale_time
+        self.Screen.itemconfig(self.X_Label_0,text="0.0",fill="yellow")
+
+    # Roll in a batch of readings. The trace scrolls so the newest reading is at the right edge.
+    # Returns the number of readings used.
+    def Roll_Readings(self,Times,Volts,Chans):
+        if self.Roll_Origin is None:
+            self.Roll_Origin=min(Times)
+        # One pixel of room at the right, so the newest reading is never cut off at the edge
+        New_Px=int(math.ceil((max(Times)-self.Roll_Origin)*Xscale))+1
+        if New_Px > self.Roll_Px:
+            self.Screen.move("roll",self.Roll_Px-New_Px,0)
+            Scope_Stats.Canvas_Calls += 1
+            self.Roll_Px=New_Px
+        Offset=self.Roll_Px-pix_width
+        StartTime=self.Roll_Origin+(self.Roll_Px-X_Axis_Pixels)/Xscale
+        Used=0
+        Split=Split_Channels(Times,Volts,Chans)
+        for Chan in Split:
+            if Chan not in self.Roll_Traces:
+                self.Roll_Traces[Chan]=Roll_Trace(self.Screen,self.Chan_Color(Chan))
+            Used += self.Roll_Traces[Chan].Add_Readings(Split[Chan][0],Split[Chan][1],StartTime,Offset)
+        for Chan in self.Roll_Traces:
+            self.Roll_Traces[Chan].Show(Offset,self.Roll_Px-X_Axis_Pixels)
+        Scope_Stats.Frame_Done()
+        return Used
+
     # Start a new trace at x=Y_Lab_width+1 pixel. Any line object needs starting and ending
-    # coordinates. The first line location is determined here. Subsequent lines will use the ending
-    # location of the previous line as its first coordinate and its end coordinate will be determined
-    # elsewhere.
+    # coordinates. The first line location is determined when the first reading of each channel
+    # arrives. Subsequent lines will use the ending location of the previous line as its first
+    # coordinate and its end coordinate will be determined elsewhere.
     def New_Trace(self):
-        global x1,y1,x2,y2
         global LinePtr
-        global Y_Lab_width,X_Lab_height
-        global Y_Axis_Pixels,X_Axis_Pixels
-        global Xscale,Yscale
-        global Volts_y1,Volts_y2
-        global FaultCode
-        global Time_x1,Time_x2,TraceStartTime
-        for ii in range(LinePtr+2): # Blank out the previous trace
-            self.Screen.coords(self.Lines[ii],0,0,0,0)
-            self.Screen.itemconfig(self.Lines[ii],fill="black")
-        Time_x1=ReadTime_A.value # If AD routine is running ReadTime_x.value will change
-        TryNumber=0
-        FirstPointTest=False
-        # Spin around here waiting for the read time to change. This means the AD converter
-        # module, which is concurrently running with this code, has actually got a reading
-        # for the first point.
-        while not FirstPointTest:
-            if Time_x1 == ReadTime_A.value:
-                time.sleep(0.001) # Wait a millisecond and go read again
-                TryNumber += 1
-                if TryNumber > 1000: # 1000 tries is 1 second. AD should be faster than that
-                    FaultCode=1 # AD program isn't running or updating time for some reason
-                    break
-            else:
-                TraceStartTime=ReadTime_A.value # Time stamp of first pixel of trace (x = 0)
-                Time_x1=TraceStartTime
-                Volts_y1=ADvalue_A.value
-                FirstPointTest=True
-        # It takes two points to draw a line. Spin here to get the second point when the read
-        # time changes again.
-        Time_x2=ReadTime_A.value
-        TryNumber=0
-        SecondPointTest=False
-        while FirstPointTest and (not SecondPointTest):
-            if Time_x2 == ReadTime_A.value:
-                time.sleep(0.001) # Wait a millisecond and go read again
-                TryNumber += 1
-                if TryNumber > 1000: # 1000 tries is 1 second. AD should be faster than that
-                    FaultCode=2 # AD program isn't running or updating time for some reason
-                    break
+        global FirstPoint_A
+        if Scope_Persist is not None: # The previous trace goes into the persistence image
+            Scope_Persist.Sweep_Done()
+        for Chan in self.Chan_Traces: # Blank out the previous trace
+            self.Chan_Traces[Chan].Clear()
+            self.Chan_Traces[Chan].Color=self.Chan_Color(Chan)
+        if self.Raster is not None:
+            self.Raster.Clear()
+        # The rings are not skipped here. Draw_Samples has already drained them into the batch
+        # the new trace starts with, and anything that came in since belongs to the new trace.
+        LinePtr=0
+        FirstPoint_A=True
+
+    # Scope channel "A" is green. Extra channels in multi-channel mode get their own color.
+    def Chan_Color(self,Chan):
+        if Chan == Scope_Ctl_A.Chan:
+            return "green"
+        return Chan_Colors[Chan]
+
+    # Add a batch of readings from one A/D channel. Returns LastLine and the number of readings
+    # used, as Chan_Trace.Add_Readings does.
+    def Add_Readings(self,Chan,Times,Volts):
+        if Chan not in self.Chan_Traces:
+            if self.Raster is not None:
+                self.Chan_Traces[Chan]=Raster_Trace(self.Raster,self.Chan_Color(Chan))
             else:
-                Time_x2=ReadTime_A.value
-                Volts_y2=ADvalue_A.value
-                SecondPointTest=True
-
-        if SecondPointTest:
-            # Convert time and volts to pixel coordinates
-            # Place x1
-            x1=Y_Lab_width+1
-            # Place y1
-            y1=round(Volts_y1 * Yscale)
-            if y1 < 1:
-                y1 = 1 # Keep over voltage on the screen (top of Y axis)
-            if y1 > Y_Axis_Pixels:
-                y1 = Y_Axis_Pixels # Keep under voltage on the screen (bottom of Y axis)
-            y1=pix_height-X_Lab_height-y1 #Invert y-axis location (0 is top pixel on a canvas)
-            # Place x2
-            x2=round((Time_x2-TraceStartTime)* Xscale)+Y_Lab_width
-            if x2 >= pix_width:
-                x2 = pix_width
-                LastLine=True
-            # Place y2
-            y2=round(Volts_y2 * Yscale)
-            if y2 < 1:
-                y2 = 1 # Keep over voltage on the screen (top of Y axis)
-            if y2 > Y_Axis_Pixels:
-                y2 = Y_Axis_Pixels # Keep under voltage on the screen (bottom of Y axis)
-            y2=Y_Axis_Pixels-y2 #Invert y-axis location (0 is top pixel on a canvas)
-
-            LinePtr=0 # Point to first line in huge line array
-            Color_Me = "green"
-            if Thresh_A and ((Volts_y1 >= Threshold_A) or (Volts_y2 >= Threshold_A)):
-                Color_Me= "red"
-            self.Draw_Line(Color_Me)
-
-    def Draw_Line(self,ThisColor):
-        global x1,y1,x2,y2
-        global LinePtr
-        global StartNewTrace
-        global LastLine
-        global SingleSweepA
-
-        self.Screen.coords(self.Lines[LinePtr],x1,y1,x2,y2)#Place line
-        self.Screen.itemconfig(self.Lines[LinePtr],fill=ThisColor) # Color the line
-        # If this is the last line for this sweep, set up for new sweep
-        if LastLine:
-            # Diagnostic print showing how many lines in this trace and last line coordinates.
-            # Comment out when not needed.
-            #print("Last line LinePtr =",LinePtr," X1=",x1," Y1=",y1," X2=",x2," Y2=",y2)
-            StartNewTrace=True
-            LastLine=False
-            SingleSweepA=False # This is the end of a single sweep
+                self.Chan_Traces[Chan]=Chan_Trace(self.Screen,self.Chan_Color(Chan))
+        return self.Chan_Traces[Chan].Add_Readings(Times,Volts)
+
+    # Put everything new on the screen at once
+    def Show_Trace(self):
+        for Chan in self.Chan_Traces:
+            self.Chan_Traces[Chan].Show()
+        if self.Raster is not None:
+            self.Raster.Show()
+        Scope_Stats.Frame_Done()
+
+    # Draw a whole trace from readings already split by channel, as Recording.Window gives them,
+    # with StartTime at the left edge
+    def Show_Window(self,StartTime,Split):
+        global TraceStartTime
+        self.New_Trace()
+        TraceStartTime=StartTime
+        for Chan in Split:
+            if Split[Chan][0]:
+                self.Add_Readings(Chan,Split[Chan][0],Split[Chan][1])
+        self.Show_Trace()
         
 # Set up display section for threshold setting and on/off selection
 # Note: This threshold for line display color, not trigger.
@@ -651,6 +2533,77 @@ class Threshold_Set_A(LabelFrame):
         global Thresh_A
         Thresh_A = False
 
+# Set up display section for persistence mode on/off and its decay setting
+class Persist_Sel(LabelFrame):
+
+    def __init__(self,parent,**kw):
+
+        super(Persist_Sel,self).__init__(parent,relief=GROOVE,bd=5,padx=2,pady=2,
+                                          fg="black",text="Persistence",**kw)
+        self.parent=parent
+        self.Persist_On=IntVar()
+        self.Persist_Btn=Checkbutton(self,bd=5,indicatoron=0,variable=self.Persist_On,width=5,
+                                     selectcolor="green",text="Persist",command=self.Persist_Mod)
+        self.Decay_Label=Label(self,text=str(Persist_Decay),bd=5,width=5,anchor=E,relief=RIDGE,bg="yellow")
+        self.Decay_Btn=Button(self,bd=5,text="Mod",relief=RAISED,width=3,padx=5,pady=0,command=self.Decay_Mod)
+        self.Persist_Btn.grid(row=0,column=0,columnspan=2)
+        self.Decay_Label.grid(row=1,column=0)
+        self.Decay_Btn.grid(row=1,column=1)
+
+    # Turning persistence on starts with a clear image, turning it off removes the image
+    def Persist_Mod(self):
+        global Scope_Persist
+        if self.Persist_On.get():
+            if Scope_Persist is None:
+                Scope_Persist=Persistence(self.parent.TraceGraph)
+        elif Scope_Persist is not None:
+            Scope_Persist.Close()
+            Scope_Persist=None
+
+# Modify the persistence decay. Old counts are multiplied by this each sweep. 1.0 never fades.
+    def Decay_Mod(self):
+        global Persist_Decay
+        Results=askfloat("Floating Point","Persistence Decay (0.5-1.0)",parent=self,\
+                            initialvalue=Persist_Decay,minvalue=0.5,maxvalue=1.0)
+        if Results != None:
+            Persist_Decay = Results
+            self.Decay_Label.config(text=str(Persist_Decay),width=5,anchor=E,bg="yellow")
+
+# Averaging. Avg sets the number of sweeps averaged on the trace and Box the number of readings
+# of each channel the A/D readers average. 1 turns either off.
+class Average_Sel(LabelFrame):
+
+    def __init__(self,parent,**kw):
+
+        super(Average_Sel,self).__init__(parent,relief=GROOVE,bd=5,padx=2,pady=2,
+                                          fg="black",text="Averaging",**kw)
+        self.Sweeps_Label=Label(self,text=str(Average_Sweeps)+"x",bd=5,width=5,anchor=E,relief=RIDGE,bg="yellow")
+        self.Sweeps_Btn=Button(self,bd=5,text="Avg",relief=RAISED,width=3,padx=5,pady=0,command=self.Sweeps_Mod)
+        self.Boxcar_Label=Label(self,text=str(Scope_Ctl_A.Boxcar)+"x",bd=5,width=5,anchor=E,relief=RIDGE,bg="yellow")
+        self.Boxcar_Btn=Button(self,bd=5,text="Box",relief=RAISED,width=3,padx=5,pady=0,command=self.Boxcar_Mod)
+        self.Sweeps_Label.grid(row=0,column=0)
+        self.Sweeps_Btn.grid(row=0,column=1)
+        self.Boxcar_Label.grid(row=1,column=0)
+        self.Boxcar_Btn.grid(row=1,column=1)
+
+# Modify the number of sweeps averaged. The average starts again from the next sweep.
+    def Sweeps_Mod(self):
+        global Average_Sweeps,Scope_Average
+        Results=askinteger("Integer","Sweeps To Average (1-256)",parent=self,\
+                            initialvalue=Average_Sweeps,minvalue=1,maxvalue=256)
+        if Results != None:
+            Average_Sweeps = Results
+            Scope_Average=Sweep_Average(Average_Sweeps) if Average_Sweeps > 1 else None
+            self.Sweeps_Label.config(text=str(Average_Sweeps)+"x",width=5,anchor=E,bg="yellow")
+
+# Modify the number of readings of each channel the A/D readers average
+    def Boxcar_Mod(self):
+        Results=askinteger("Integer","Readings To Average (1-64)",parent=self,\
+                            initialvalue=Scope_Ctl_A.Boxcar,minvalue=1,maxvalue=64)
+        if Results != None:
+            Control_Set(Boxcar=Results)
+            self.Boxcar_Label.config(text=str(Results)+"x",width=5,anchor=E,bg="yellow")
+
 # Set up display section for sweep selection
 class Sweep_Select_A(LabelFrame):
     
@@ -664,16 +2617,20 @@ class Sweep_Select_A(LabelFrame):
         self.SweepA_SING_btn=Radiobutton(self,bd=5,indicatoron=0,variable=SweepSelectA,value=2,width=5,
                                     selectcolor="green",text="Sing",command=self.SweepA_SING)
         self.SweepA_NOW_btn=Button(self,bd=5,text="Man Trig",relief=RAISED,width=8,padx=4,pady=2,command=self.SweepA_NOW)
+        self.SweepA_ROLL_btn=Radiobutton(self,bd=5,indicatoron=0,variable=SweepSelectA,value=3,width=5,
+                                    selectcolor="green",text="Roll",command=self.SweepA_ROLL)
 
         self.SweepA_CONT_btn.grid(row=0,column=0)
         self.SweepA_SING_btn.grid(row=0,column=1)
         self.SweepA_NOW_btn.grid(row=1,column=0,columnspan=2)
+        self.SweepA_ROLL_btn.grid(row=2,column=0,columnspan=2)
         
         SweepSelectA.set(1) # On startup set button default to 1 (Continuous)
 
     def SweepA_CONT(self):
         global ContinuousSweepA,SingleSweepA,Trigger_Sel
         if not Trigger_Sel: # Do not allow auto continuous trace if a trigger has been selected
+            Roll_Off()
             ContinuousSweepA=True
             SingleSweepA=False
         else:
@@ -681,15 +2638,34 @@ class Sweep_Select_A(LabelFrame):
 
     def SweepA_SING(self):
         global ContinuousSweepA,SingleSweepA
+        Roll_Off()
         ContinuousSweepA=False
         SingleSweepA=True
 
+    # Roll mode. Like continuous sweep, not allowed if a trigger has been selected.
+    def SweepA_ROLL(self):
+        global ContinuousSweepA,SingleSweepA,Roll_Mode,NewXscale
+        if not Trigger_Sel:
+            Roll_Mode=True
+            ContinuousSweepA=False
+            SingleSweepA=False
+            NewXscale=XScaleSelect.get() # Update_All sets the trace up for rolling
+        else:
+            SweepSelectA.set(2)
+
     def SweepA_NOW(self):
         global ContinuousSweepA,SingleSweepA
         if SweepSelectA.get()==2:
             ContinuousSweepA=False
             SingleSweepA=True
 
+# Leave roll mode, if it is on. Update_All puts the trace back to sweeps.
+def Roll_Off():
+    global Roll_Mode,NewXscale
+    if Roll_Mode:
+        Roll_Mode=False
+        NewXscale=XScaleSelect.get()
+
 # Set up display section for trigger selection
 class Trigger_Sel_A(LabelFrame):
     
@@ -708,6 +2684,9 @@ class Trigger_Sel_A(LabelFrame):
         # Set up trigger threshold A value display in a label and it's modification button
         self.TrigThresh_A_Label=Label(self,text=str(TrigThresh_A),bd=5,width=5,anchor=E,relief=RIDGE,bg="yellow")
         self.TrigThreshBtnA=Button(self,bd=5,text="Mod",relief=RAISED,width=3,padx=5,pady=0,command=self.TrigThresh_A_Mod)
+        # Trigger position, as percent of the screen before the trigger, and its modification button
+        self.Trig_Pos_Label=Label(self,text=str(Trig_Position)+"%",bd=5,width=5,anchor=E,relief=RIDGE,bg="yellow")
+        self.Trig_Pos_Btn=Button(self,bd=5,text="Pos",relief=RAISED,width=3,padx=5,pady=0,command=self.Trig_Pos_Mod)
 
         # Note: Trig_PIN_btn[0] is actually the None (no trigger) button
         self.Trig_PIN_btn[0].grid(row=0,column=0,columnspan=2)
@@ -734,6 +2713,8 @@ class Trigger_Sel_A(LabelFrame):
         self.Trig_PIN_btn[9].grid(row=9,column=0,columnspan=2)
         self.TrigThresh_A_Label.grid(row=10,column=0)
         self.TrigThreshBtnA.grid(row=10, column=1)
+        self.Trig_Pos_Label.grid(row=11,column=0)
+        self.Trig_Pos_Btn.grid(row=11,column=1)
         
         Trigger_Select.set(0) # On startup set button default to 0 (None)
         Config_Select.set(0) # On start up no config buttons are selected
@@ -823,18 +2804,23 @@ class Trigger_Sel_A(LabelFrame):
 # Trigger selected. The specific trigger selected will be contained in the Radiobutton
 # variable "Trigger_Select"
     def Trig_Exec(self):
-        global Trigger_Sel,SweepSelectA,ContinuousSweepA,SingleSweepA,MsgCode
+        global Trigger_Sel,SweepSelectA,ContinuousSweepA,SingleSweepA,MsgCode,Trig_Time
         self.n=Trigger_Select.get()
+        Trig_Time=None
+        Control_Set(Trig_Thresh=1 if self.n == 9 else 0) # The A/D readers look for the threshold trigger
         if self.n == 0:
             # Trigger selected is "None"
 #            print("No trigger selected")
             Trigger_Sel=False
+            Trig_Pin_Watch(0)
             ContinuousSweepA=True
             SingleSweepA=False
             SweepSelectA.set(1)
         else:
             if Trig_Pin_Conf[self.n]: # Test if this trigger has been configured.
                 Trigger_Sel = True
+                Roll_Off()
+                Trig_Pin_Watch(self.n) # Pin triggers are caught by an edge interrupt
             # If the scope is in continuous sweep mode, turn it off, but switch to single sweep
             # mode so the current trace completes before testing for trigger
                 if ContinuousSweepA:
@@ -845,6 +2831,7 @@ class Trigger_Sel_A(LabelFrame):
                 MsgCode=3
                 Trigger_Select.set(0)
                 Trigger_Sel=False
+                Trig_Pin_Watch(0)
             
 # Modify the trigger threshold value. Note: This is not the line display color threshold.
     def TrigThresh_A_Mod(self):
@@ -853,8 +2840,18 @@ class Trigger_Sel_A(LabelFrame):
                             initialvalue=TrigThresh_A,minvalue=0.0,maxvalue=5.0)
         if Results != None:
             TrigThresh_A = Results
+            Control_Set(Trig_Volts=TrigThresh_A)
             self.TrigThresh_A_Label.config(text=str(TrigThresh_A),width=5,anchor=E,bg="yellow")
 
+# Modify the trigger position, how much of a triggered trace comes from before the trigger
+    def Trig_Pos_Mod(self):
+        global Trig_Position
+        Results=askinteger("Integer","Screen Before Trigger (Percent)",parent=self,\
+                            initialvalue=Trig_Position,minvalue=0,maxvalue=90)
+        if Results != None:
+            Trig_Position = Results
+            self.Trig_Pos_Label.config(text=str(Trig_Position)+"%",width=5,anchor=E,bg="yellow")
+
 # Set up display section for sweep time selection
 class XScale_Select(LabelFrame):
     
@@ -946,10 +2943,25 @@ class AD_Channel_Sel(LabelFrame):
         self.Chan_8_btn.grid(row=0,column=7)
         Sel_Chan.set(1) # On startup set button default to channel 1
 
+        # Multi-channel mode. Each "+" button adds its channel to the scan along with the channel
+        # selected above. The buttons are colored to match their trace.
+        self.Multi_Chan=[None]
+        self.Multi_Chan_btn=[None]
+        for i in range(1,9):
+            self.Multi_Chan.append(IntVar())
+            self.Multi_Chan_btn.append(Checkbutton(self,bd=5,indicatoron=0,variable=self.Multi_Chan[i],width=3,
+                                    selectcolor=Chan_Colors[i],text="+",command=self.New_Chan_Set))
+            self.Multi_Chan_btn[i].grid(row=1,column=i-1)
+
     def New_Channel(self):
-        global ADchannel_A
-        ADchannel_A.value=Sel_Chan.get()
-        #print("New channel selected =",ADchannel_A.value)
+        Control_Set(Chan=Sel_Chan.get())
+        #print("New channel selected =",Scope_Ctl_A.Chan)
+
+    def New_Chan_Set(self):
+        Chan_Set=(ctypes.c_int*9)()
+        for i in range(1,9):
+            Chan_Set[i]=self.Multi_Chan[i].get()
+        Control_Set(Chan_Set=Chan_Set)
 
 # Set up the AD resolution and i2c address settings display and modify button
 class AD_Settings(LabelFrame):
@@ -969,6 +2981,16 @@ class AD_Settings(LabelFrame):
         Label(self,text="  ").grid(row=0,column=6) # Dummy label for a little space before the button
         self.Mod_Set_btn=Button(self,bd=5,text="Mod",relief=RAISED,width=3,padx=5,pady=0,command=self.Modify_Settings)
         self.Mod_Set_btn.grid(row=0,column=7)
+        # Parallel mode runs one A/D reader per converter chip
+        self.Parallel=IntVar()
+        self.Parallel_btn=Checkbutton(self,bd=5,indicatoron=0,variable=self.Parallel,width=3,
+                                      selectcolor="green",text="Par",command=self.Parallel_Mod)
+        self.Parallel_btn.grid(row=0,column=8)
+        # Streaming mode keeps the converter in continuous conversion
+        self.Stream=IntVar()
+        self.Stream_btn=Checkbutton(self,bd=5,indicatoron=0,variable=self.Stream,width=3,
+                                    selectcolor="green",text="Strm",command=self.Stream_Mod)
+        self.Stream_btn.grid(row=0,column=9)
 
     def Modify_Settings(self):
         global AD_ResX,AdrsX1,AdrsX2,AD_Mod
@@ -1018,6 +3040,12 @@ class AD_Settings(LabelFrame):
         AD_Apply_btn=Button(AD_Mod,bd=2,text="Apply",relief=RAISED,command=self.AD_Apply_Mod)
         AD_Apply_btn.grid(row=15, column=2)
 
+    def Parallel_Mod(self):
+        Control_Set(Parallel=self.Parallel.get())
+
+    def Stream_Mod(self):
+        Control_Set(Stream=self.Stream.get())
+
 # Modify the bit resolution value. This also detertmines rate samples per second (SPS).
     def AD_BitRes_Mod(self):
         global AD_ResX,AD_Mod
@@ -1056,14 +3084,10 @@ class AD_Settings(LabelFrame):
         global AD_Mod
         global AD_ResX,AdrsX1,AdrsX2
         global AD_Res,Adrs1,Adrs2
-        global AD_Bits_A,AD_Adrs1_A,AD_Adrs2_A
         AD_Res=AD_ResX
         Adrs1=AdrsX1
         Adrs2=AdrsX2
-        AD_Bits_A.value=AD_Res
-        AD_Adrs1_A.value=Adrs1
-        AD_Adrs2_A.value=Adrs2
-        AD_Set_A.value=1
+        Control_Set(Bits=AD_Res,Adrs1=Adrs1,Adrs2=Adrs2,Set=Scope_Ctl_A.Set+1)
         self.Bit_Res.config(text=str(AD_Res),width=3,anchor=E,bg="yellow")
         self.BusADR1.config(text=str(Adrs1),width=3,anchor=E,bg="yellow")
         self.BusADR2.config(text=str(Adrs2),width=3,anchor=E,bg="yellow")
@@ -1080,10 +3104,164 @@ class Status_Message(LabelFrame):
         self.fgcolor=FgColor
         self.MsgLabel=Label(self,text=self.message,width=40,relief=GROOVE,bg=self.bgcolor,fg=self.fgcolor)
         self.MsgLabel.grid(row=0, column=0)
+        # Live run time statistics, shown under the message when turned on
+        self.Stats_On=IntVar()
+        self.Stats_btn=Checkbutton(self,bd=5,indicatoron=0,variable=self.Stats_On,width=5,
+                                   selectcolor="green",text="Stats",command=self.Stats_Mod)
+        self.Stats_btn.grid(row=0, column=1)
+        self.StatsLabel=Label(self,text="",width=58,relief=GROOVE,bg="black",fg="cyan",anchor=W)
 
     def Show_Message(self,Usr_Message,Bg_Color,Fg_Color):
         self.MsgLabel.config(text=Usr_Message, bg=Bg_Color, fg=Fg_Color)
 
+    def Show_Stats(self,Stats_Text):
+        self.StatsLabel.config(text=Stats_Text)
+
+    def Stats_Mod(self):
+        if self.Stats_On.get():
+            Stats_Line() # Start the rates from now
+            self.StatsLabel.grid(row=1, column=0, columnspan=2)
+        else:
+            self.StatsLabel.grid_remove()
+
+# Set up display section for recording to disk
+class Record_Sel(LabelFrame):
+
+    def __init__(self,parent,**kw):
+
+        super(Record_Sel,self).__init__(parent,relief=GROOVE,bd=5,padx=2,pady=2,
+                                        fg="black",text="Record",**kw)
+
+        self.Rec_On=IntVar()
+        self.Rec_btn=Checkbutton(self,bd=5,indicatoron=0,variable=self.Rec_On,width=5,
+                                 selectcolor="red",text="REC",command=self.Rec_Mod)
+        self.Rec_btn.grid(row=0,column=0)
+        self.Rec_Label=Label(self,text="Off",width=10,relief=RIDGE,bg="black",fg="green")
+        self.Rec_Label.grid(row=0,column=1)
+
+    def Rec_Mod(self):
+        global Scope_Recorder
+        if self.Rec_On.get():
+            if Scope_Recorder is None:
+                Scope_Recorder=Recorder(Record_Dir or ".")
+        elif Scope_Recorder is not None:
+            Scope_Recorder.Stop()
+            Scope_Recorder=None
+        self.Show_Size()
+
+    # Show how much has been recorded, or that there is a problem writing it
+    def Show_Size(self):
+        if Scope_Recorder is None:
+            self.Rec_Label.config(text="Off",fg="green")
+        elif Scope_Recorder.Failed: # Nothing can be recorded. Turn recording off and say why.
+            self.Rec_On.set(0)
+            self.Rec_Mod()
+            self.Rec_Label.config(text="Open Error",fg="red")
+        elif Scope_Recorder.Error:
+            self.Rec_Label.config(text="Write Error",fg="red")
+        else:
+            self.Rec_Label.config(text="%.2f MB" % (Scope_Recorder.Bytes/1000000.0),fg="red")
+
+# Set up display section for playing back a recording. The view spans the selected X scale
+# times the zoom factor and can be moved along the recording a tick (a quarter of the view) or
+# a whole view at a time.
+class Playback_Sel(LabelFrame):
+
+    def __init__(self,parent,**kw):
+
+        super(Playback_Sel,self).__init__(parent,relief=GROOVE,bd=5,padx=2,pady=2,
+                                          fg="black",text="Playback",**kw)
+        self.parent=parent
+        self.Zoom=1 # Seconds shown are xScale_time times this
+        self.Position=0.0 # Time stamp at the left edge of the view
+
+        Button(self,bd=2,text="Open",relief=RAISED,width=4,command=self.Play_Open).grid(row=0,column=0)
+        Button(self,bd=2,text="|<",relief=RAISED,width=2,command=self.Play_Home).grid(row=0,column=1)
+        Button(self,bd=2,text="<<",relief=RAISED,width=2,
+               command=lambda: self.Play_Move(-1.0)).grid(row=0,column=2)
+        Button(self,bd=2,text="<",relief=RAISED,width=2,
+               command=lambda: self.Play_Move(-0.25)).grid(row=0,column=3)
+        Button(self,bd=2,text=">",relief=RAISED,width=2,
+               command=lambda: self.Play_Move(0.25)).grid(row=0,column=4)
+        Button(self,bd=2,text=">>",relief=RAISED,width=2,
+               command=lambda: self.Play_Move(1.0)).grid(row=0,column=5)
+        Button(self,bd=2,text=">|",relief=RAISED,width=2,command=self.Play_End).grid(row=0,column=6)
+        Button(self,bd=2,text="Out",relief=RAISED,width=3,
+               command=lambda: self.Play_Zoom(10)).grid(row=0,column=7)
+        Button(self,bd=2,text="In",relief=RAISED,width=3,
+               command=lambda: self.Play_Zoom(0.1)).grid(row=0,column=8)
+        Button(self,bd=2,text="Close",relief=RAISED,width=4,command=self.Play_Close).grid(row=0,column=9)
+        self.Play_Label=Label(self,text="No recording",width=28,relief=RIDGE,bg="black",fg="green")
+        self.Play_Label.grid(row=0,column=10)
+
+    def Play_Open(self):
+        global Scope_Playback
+        File_Name=filedialog.askopenfilename(parent=self,title="Open Recording",initialdir=Record_Dir or ".",
+                                             filetypes=[("Scope recordings","*.ssr"),("All files","*")])
+        if not File_Name:
+            return
+        try:
+            New_Recording=Recording(File_Name)
+        except (OSError,ValueError) as Problem:
+            messagebox.showerror("Playback","Can't open %s\n%s" % (File_Name,Problem))
+            return
+        if Scope_Playback is not None:
+            Scope_Playback.Close()
+        Scope_Playback=New_Recording
+        self.Zoom=1
+        self.Position=Scope_Playback.First_Time
+        self.Redraw()
+
+    def Play_Close(self):
+        global Scope_Playback,Xscale,NewXscale,MsgCode
+        if Scope_Playback is None:
+            return
+        Scope_Playback.Close()
+        Scope_Playback=None
+        self.Play_Label.config(text="No recording")
+        Xscale=X_Axis_Pixels/xScale_time # Back to live, on the selected X scale
+        NewXscale=XScaleSelect.get()
+        MsgCode=0
+
+    def Play_Home(self):
+        if Scope_Playback is not None:
+            self.Position=Scope_Playback.First_Time
+            self.Redraw()
+
+    def Play_End(self):
+        if Scope_Playback is not None:
+            self.Position=Scope_Playback.Last_Time
+            self.Redraw()
+
+    # Move the view by Views views. Negative is back.
+    def Play_Move(self,Views):
+        if Scope_Playback is not None:
+            self.Position += Views*xScale_time*self.Zoom
+            self.Redraw()
+
+    def Play_Zoom(self,Factor):
+        if Scope_Playback is not None:
+            Length=Scope_Playback.Last_Time-Scope_Playback.First_Time
+            if Factor > 1 and xScale_time*self.Zoom >= Length:
+                return # Already showing the whole recording
+            self.Zoom=max(int(round(self.Zoom*Factor)),1)
+            self.Redraw()
+
+    # Draw the view. Also called when a new X scale is selected.
+    def Redraw(self):
+        global Xscale
+        if Scope_Playback is None:
+            return
+        Span=xScale_time*self.Zoom
+        self.Position=max(min(self.Position,Scope_Playback.Last_Time-Span),Scope_Playback.First_Time)
+        Xscale=X_Axis_Pixels/Span
+        Graph=self.parent.TraceGraph
+        Graph.Span_X(Span)
+        Graph.Show_Window(self.Position,Scope_Playback.Window(self.Position,Span,int(X_Axis_Pixels)))
+        self.Play_Label.config(text="%.2f of %.2f s  x%d" % (self.Position-Scope_Playback.First_Time,
+                                                            Scope_Playback.Last_Time-Scope_Playback.First_Time,
+                                                            self.Zoom))
+
 # Set up display section for Scope ON/OFF button
 class Scope_On_Off(LabelFrame):
     
@@ -1098,27 +3276,31 @@ class Scope_On_Off(LabelFrame):
 
 
     def PowerOnOff(self):
-        global ScopePower
         global MsgCode
         global adc,bus,Adrs1,Adrs2,AD_Res
-        global AD_Bits_A,AD_Adrs1_A,AD_Adrs2_A,AD_Set_A
         
-        if ScopePower.value==0:
+        if Scope_Ctl_A.Power==0:
             try:
                 adc = ADCPi(bus, Adrs1, Adrs2, AD_Res) # Set bus, adrs1, adrs2, rate
             except IOError:
                 MsgCode=5
             else:
-                ScopePower.value=1
-                AD_Bits_A.value=AD_Res
-                AD_Adrs1_A.value=Adrs1
-                AD_Adrs2_A.value=Adrs2
-                AD_Set_A.value=1
+                Control_Set(Power=1,Bits=AD_Res,Adrs1=Adrs1,Adrs2=Adrs2,Set=Scope_Ctl_A.Set+1)
                 self.Scope_btn.config(fg="green")
         else:
-            ScopePower.value=0
+            Control_Set(Power=0)
             self.Scope_btn.config(fg="black")
 
+
+# Screen updates. New readings are drawn by Render_Frame at a steady Frame_Rate frames a second,
+# set with --fps=N (or SCOPE_FPS=N in the environment), not as each one arrives. The wake up pipe
+# from the A/D readers only marks that there are readings waiting, and each frame takes all of
+# them from the rings and adds them to the trace in one batch. If drawing a frame takes more than
+# Frame_Busy of the frame time, or frames fall due while one is still being drawn, the frames that
+# can't be kept up with are skipped, so on a loaded Pi the screen updates less often instead of
+# Tk events and the A/D readers being starved. The rings hold the readings until the next frame.
+Frame_Rate = Number_Option("--fps","SCOPE_FPS",30.0,1.0,240.0)
+Frame_Busy=0.5
         
 # This is the main app frame. The GUI is driven from here and
 # almost all of the non-GUI code is in here.
@@ -1153,6 +3335,12 @@ class App(Frame):
         # Place Sweep select on screen
         self.SweepAGraph=Sweep_Select_A(self)
         self.SweepAGraph.grid(row=1,column=0,sticky=S)
+
+        self.PersistGraph=Persist_Sel(self)
+        self.PersistGraph.grid(row=2,column=0,sticky=N)
+        # Place the averaging settings on screen
+        self.AverageGraph=Average_Sel(self)
+        self.AverageGraph.grid(row=3,column=0,sticky=N)
         # Place power on/off button on screen
         self.PowOnOff=Scope_On_Off(self)
         self.PowOnOff.grid(row=5,column=0)
@@ -1165,32 +3353,54 @@ class App(Frame):
         # Place user status messages section
         self.StatusMessage=Status_Message(self,"Auto","black","yellow")
         self.StatusMessage.grid(row=5,column=2)
+        # Place the recording control
+        self.RecGraph=Record_Sel(self)
+        self.RecGraph.grid(row=5,column=3)
+        # Place the playback controls
+        self.PlayGraph=Playback_Sel(self)
+        self.PlayGraph.grid(row=6,column=1,columnspan=2)
         
         ###################################################################
         ############## END OF MAIN GRAPHIC WINDOW LAYOUT ##################
         ###################################################################
         
+        # The A/D reader signals new readings through the wake up pipe, and Render_Frame draws
+        # them on the next frame. If Tk can't watch the pipe, fall back to checking the ring's
+        # sample count on a timer.
+        self.Last_Wake_Time=time.time()
+        self.Samples_Waiting=False # Set by Sample_Wake, cleared when a frame draws them
+        self.Carry=None # Readings past the end of the last continuous sweep, to start the next one
+        self.Frame_Due=time.perf_counter() # When the next frame should be drawn
+        self.Stats_Line_Time=time.time()
+        self.Rec_Label_Time=time.time()
+        if Record_Dir: # Unattended logging. Start recording now.
+            self.RecGraph.Rec_On.set(1)
+            self.RecGraph.Rec_Mod()
+        if Profile_Dir:
+            self.Profiler=Profile_Start()
+            self.Update_All=Profile_Tick(self.Update_All,"Update_All",self.Profiler)
+            self.Render_Frame=Profile_Tick(self.Render_Frame,"Render_Frame",self.Profiler)
+        try:
+            self.tk.createfilehandler(Wake_Read_A,READABLE,self.Sample_Wake)
+        except (AttributeError,TclError):
+            self.Sample_Poll()
         self.Update_All()# Start scan loop here inside the main class app by invoking update method
+        self.Render_Frame() # and the screen updates
 
-    # Runs on a set ms cycle to check the state of the A/D and GPIO inputs.
+    # Runs on a set ms cycle to check the state of the GPIO inputs and keep the status message
+    # up to date. Drawing is done in Render_Frame.
     # SEE THE LAST LINE IN THIS METHOD FOR THE CYCLE TIME.                  
     def Update_All(self):
 
-        global x1,y1,x2,y2
-        global LinePtr, Max_Lines
-        global Y_Lab_width,X_Lab_height
-        global Xscale,Yscale
-        global Y_Axis_Pixels,X_Axis_Pixels
-        global Volts_y1,Volts_y2
+        global LinePtr
         global FaultCode
-        global Time_x1,Time_x2,TraceStartTime
-        global StartNewTrace
-        global LastLine,ContinuousSweepA,SingleSweepA
-        global Trigger_Sel,Trigger_Select,TrigThresh_A
+        global StartNewTrace,FirstPoint_A
+        global ContinuousSweepA,SingleSweepA
+        global Trigger_Sel,Trigger_Select
         global NewXscale
         global MsgCode,OldMsgCode
-        global Trig_Pin_Conf,Trig_Pin_GPIO
-        global ScopePower, AD_Error_A
+        global Trig_Pin_Conf,Trig_Pin_GPIO,Trig_Time
+        Start_Time=time.perf_counter()
 
     # User selected a new X scale on the fly.
         if NewXscale > 0:
@@ -1206,15 +3416,24 @@ class App(Frame):
                 self.TraceGraph.Four_Second_X()
             NewXscale=0
             StartNewTrace=True
+            if Roll_Mode:
+                self.TraceGraph.Roll_Start()
+            else:
+                self.TraceGraph.Roll_Stop()
+            self.PlayGraph.Redraw() # In playback, show the recording on the new scale
+            if Scope_Average is not None: # Old sweeps no longer line up with the new scale
+                Scope_Average.Clear()
                             
         # Process a new status message. This code needs to be ahead of the code below.
-        if AD_Error_A.value != 0:
+        if Scope_Ctl_A.Error != 0:
             MsgCode = 5
-            AD_Error_A.value=0
-            if ScopePower.value==1:
+            Control_Set(Error=0)
+            if Scope_Ctl_A.Power==1:
                 self.PowOnOff.PowerOnOff()
-        if ScopePower.value==0 and MsgCode!=5:
+        if Scope_Ctl_A.Power==0 and MsgCode!=5:
             MsgCode=4
+        if Scope_Playback is not None and MsgCode!=5:
+            MsgCode=6
         if MsgCode != OldMsgCode:
             if MsgCode == 0:
                 self.StatusMessage.Show_Message("Running","black","green")
@@ -1232,111 +3451,271 @@ class App(Frame):
                 self.StatusMessage.Show_Message("Problem with i2c address.","yellow","red")
                 self.StatusMsg_Clear_Tmr_Run=True
                 self.StatusMsg_Clear_Tmr_Complete=time.time()+3.0
+            if MsgCode == 6:
+                self.StatusMessage.Show_Message("Playing back a recording","black","cyan")
             OldMsgCode=MsgCode
 
     # If trigger mode is activated, wait for the last sweep to finish, then check for
     # an appropriate trigger before drawing a new trace. For now, traces will continue
-    # in single sweep mode as long as the selected trigger is active
+    # in single sweep mode as long as the selected trigger is active. The threshold
+    # trigger and pins watched with an edge interrupt are picked up in Draw_Samples. A pin
+    # that can't be watched, such as one set up as an output, is checked here.
         if Trigger_Sel and not SingleSweepA:
             nn = Trigger_Select.get()
-            if (nn == 9) and (ADvalue_A.value >= TrigThresh_A):
-                SingleSweepA=True
-            if (nn > 0 and nn < 9):
+            if (nn > 0 and nn < 9) and nn != Trig_Pin_Watched:
                 if Trig_Pin_Conf[nn] and GPIO.input(Trig_Pin_GPIO[nn]):
                     SingleSweepA=True
+                    Trig_Time=time.time()
+
+        # While a trace is being drawn the A/D reader should be sending readings. If it has gone
+        # quiet for a second, it isn't running or updating time for some reason.
+        if Scope_Ctl_A.Power==1 and (ContinuousSweepA or SingleSweepA or Roll_Mode):
+            if time.time()-self.Last_Wake_Time > 1.0: # AD should be faster than that
+                if FirstPoint_A:
+                    FaultCode=1 # No first point for the trace
+                elif LinePtr < 2:
+                    FaultCode=2 # No second point to finish the first line
+                else:
+                    FaultCode=3 # Readings stopped in the middle of the trace
+        else:
+            self.Last_Wake_Time=time.time()
+        if FaultCode != 0:
+            #print("Fault Code failure: ",FaultCode)
+            MsgCode=1
+            #root.quit()
+
+        # Status message clear timer
+        if self.StatusMsg_Clear_Tmr_Run and (time.time() >= self.StatusMsg_Clear_Tmr_Complete):
+            self.StatusMsg_Clear_Tmr_Run = False
+            MsgCode=0
+
+        # Recording size, once a second
+        if Scope_Recorder is not None and time.time() >= self.Rec_Label_Time:
+            self.RecGraph.Show_Size()
+            self.Rec_Label_Time=time.time()+1.0
+
+        # Live statistics line, twice a second
+        if self.StatusMessage.Stats_On.get() and time.time() >= self.Stats_Line_Time:
+            self.StatusMessage.Show_Stats(Stats_Line())
+            self.Stats_Line_Time=time.time()+0.5
+
+        Scope_Stats.Update.Add((time.perf_counter()-Start_Time)*1000000.0)
+# Continuously run "Update_All", but take a 10 millisecond breath between runs.
+        self._timer = self.after(10,self.Update_All)
+
+    # Called by Tk when the A/D reader has written to the wake up pipe. The readings are left
+    # in the rings for the next frame.
+    def Sample_Wake(self,fd,mask):
+        global FaultCode,MsgCode
+        try:
+            os.read(fd,4096) # Empty the pipe. The readings themselves are in the ring buffer.
+        except BlockingIOError:
+            pass
+        self.Last_Wake_Time=time.time()
+        self.Samples_Waiting=True
+        if FaultCode != 0: # The A/D reader has come back
+            FaultCode=0
+            MsgCode=0
+
+    # Draws the readings that have come in since the last frame, if any, then sets up the next
+    # frame. Frames whose time has gone by, and while drawing is slow some more, are skipped.
+    def Render_Frame(self):
+        Start_Time=time.perf_counter()
+        if self.Samples_Waiting:
+            self.Samples_Waiting=False
+            self.Draw_Samples()
+            Scope_Stats.Frames += 1
+            Scope_Stats.Draw.Add((time.perf_counter()-Start_Time)*1000000.0)
+        Now=time.perf_counter()
+        Period=1.0/Frame_Rate
+        Skip=int((Now-Start_Time)/(Period*Frame_Busy)) # Frames to leave out while drawing is slow
+        self.Frame_Due += Period*(1+Skip)
+        while self.Frame_Due <= Now: # Fell behind. Pick up from the next frame still to come.
+            self.Frame_Due += Period
+            Skip += 1
+        Scope_Stats.Frames_Skipped += Skip
+        self._frame_timer = self.after(max(int((self.Frame_Due-Now)*1000.0),1),self.Render_Frame)
+
+    # Used instead of Sample_Wake when Tk can't watch the wake up pipe. Reading the ring's
+    # sample counts is cheap, so only do real work when they show something new has arrived.
+    def Sample_Poll(self):
+        if (Sample_Rings[0].Head.value != Sample_Rings[0].Tail.value or
+            Sample_Rings[1].Head.value != Sample_Rings[1].Tail.value):
+            self.Sample_Wake(Wake_Read_A,READABLE)
+        self._poll_timer = self.after(10,self.Sample_Poll)
+
+    # Draw every reading that has arrived since the last call. This never waits for the A/D
+    # reader, so the Tk mainloop is never held up.
+    def Draw_Samples(self):
+
+        global LinePtr
+        global FaultCode
+        global TraceStartTime
+        global StartNewTrace,FirstPoint_A
+        global ContinuousSweepA,SingleSweepA
+        global Trigger_Sel,Trigger_Select,Trig_Time
+        global MsgCode
+
+        # Triggers found since the last call, by the A/D readers or the trigger pin interrupt. One
+        # that comes while waiting for a trigger starts a sweep.
+        Trig=Trigger_Poll()
+        if Trig is not None and Trigger_Sel and not SingleSweepA and Scope_Ctl_A.Power==1:
+            SingleSweepA=True
+            Trig_Time=Trig[0]
+            Scope_Stats.Trig.Add((time.time()-Trig_Time)*1000000.0)
+
+        if Scope_Playback is not None or Scope_Ctl_A.Power!=1: # Nothing live to look at
+            self.Drop_Carry()
+            Skip_Rings()
+            if FaultCode == 0 and not self.StatusMsg_Clear_Tmr_Run and Scope_Playback is None:
+                MsgCode = 2
+            return
+
+        # Everything that arrived since the last call. It goes into Scope_History when done
+        # with, drawn or not.
+        Times,Volts,Chans=Drain_Rings()
+        Batch=(Times,Volts,Chans)
+
+        if Roll_Mode:
+            self.Drop_Carry()
+            if Times:
+                Drawn=self.TraceGraph.Roll_Readings(Times,Volts,Chans)
+                LinePtr += Drawn
+                FirstPoint_A=False
+                Scope_Stats.Readings(len(Times),Drawn)
+                if FaultCode == 0 and not self.StatusMsg_Clear_Tmr_Run:
+                    MsgCode = 0
+            Scope_History.Add(*Batch)
+            return
 
-# Draw a trace if power is on and either sweep selection is true.
-        if ScopePower.value==1 and (ContinuousSweepA or SingleSweepA):
+# Draw a trace if either sweep selection is true
+        if ContinuousSweepA or SingleSweepA:
+            Taken=len(Times)
             if StartNewTrace: # Initialize for the first trace line
                 self.TraceGraph.New_Trace()
                 StartNewTrace=False
+                if Scope_Average is not None:
+                    Scope_Average.New_Sweep()
                 if FaultCode == 0 and not self.StatusMsg_Clear_Tmr_Run:
                     MsgCode = 0
-
-    # The end point of the previous line is the begin point of the next line, so move
-    # the previous line's x2,y2 to the new x1,y1 before calculating the new x2,y2
-    # Also, move the volts in case threshold check is on.
-            x1=x2
-            y1=y2
-            Volts_y1=Volts_y2
-        
-            # Get a new x2,y2
- #           Time_x2=ReadTime_A.value
-            TryNumber=0
-            SecondPointTest=False
-            # Spin around here waiting for the AD converter routine to give us a new reading. We know
-            # this when the ReadTime value increases after the AD read completes.
-            while not SecondPointTest:
-                if Time_x2 == ReadTime_A.value:
-                    time.sleep(0.001) # Wait a millisecond and go read again
-                    TryNumber += 1
-                    if TryNumber > 1000: # 1000 tries is 1 second. AD should be faster than that
-                        FaultCode=3 # AD program isn't running or updating time for some reason
-                        SecondPointTest=True
-                        break
-                else:
-                    Time_x2=ReadTime_A.value
-                    Volts_y2=ADvalue_A.value
-                    SecondPointTest=True
-
-            if FaultCode == 0:
-            # The begin point (x1,y1) is already in pixels, now convert the end point to pixel coords
-            # including the offset of the location of the y axis.
-                x2=round((Time_x2-TraceStartTime)* Xscale)+Y_Lab_width
-                if x2 >= pix_width:
-                    x2 = pix_width
-                    LastLine=True
-                y2=round(Volts_y2 * Yscale)
-                if y2 < 1:
-                    y2 = 1 # Keep over voltage on the screen (top of Y axis)
-                if y2 > Y_Axis_Pixels:
-                    y2 = Y_Axis_Pixels # Keep under voltage on the screen (bottom of Y axis)
-                y2=Y_Axis_Pixels-y2 #Invert y-axis location (0 is top pixel on a canvas)
-
-                LinePtr += 1 #Point to next line in huge line array
-                # Don't let the pointer outside the array size. Bump this if the array is
-                # made larger above due to a faster Pi or A/D board.
-                if LinePtr >= (Max_Lines-2):
-                    LastLine=True
-                Color_Me = "green"
-                if Thresh_A and ((Volts_y1 >= Threshold_A) or (Volts_y2 >= Threshold_A)):
-                    Color_Me= "red"
-                self.TraceGraph.Draw_Line(Color_Me)
-            else:
-                #print("Fault Code failure: ",FaultCode)
-                MsgCode=1
-                #root.quit()
+                if self.Carry is not None and Trig_Time is None:
+                    # The readings past the end of the last sweep start this one
+                    Times=self.Carry[0]+Times
+                    Volts=self.Carry[1]+Volts
+                    Chans=self.Carry[2]+Chans
+                    Taken += len(self.Carry[0])
+                    self.Carry=None
+                self.Drop_Carry()
+                if Trig_Time is not None:
+                    # A triggered trace. It starts Trig_Position percent of the screen before
+                    # the trigger, with the readings from then on that are in the history.
+                    TraceStartTime=Trig_Time-xScale_time*Trig_Position/100.0
+                    FirstPoint_A=False
+                    Trig_Time=None
+                    Pre_Times,Pre_Volts,Pre_Chans=Scope_History.Since(TraceStartTime)
+                    Split=Split_Channels(Pre_Times,Pre_Volts,Pre_Chans)
+                    for Chan in Split:
+                        Chan_Volts=Split[Chan][1]
+                        if Scope_Average is not None:
+                            Chan_Volts=Scope_Average.Add(Chan,Split[Chan][0],Chan_Volts,TraceStartTime)
+                        Chan_Last,Used=self.TraceGraph.Add_Readings(Chan,Split[Chan][0],Chan_Volts)
+                        LinePtr += Used
+                        Scope_Stats.Redrawn(Used)
+                    Keep=[k for k in range(len(Times)) if Times[k] >= TraceStartTime]
+                    if len(Keep) < len(Times):
+                        Times=[Times[k] for k in Keep]
+                        Volts=[Volts[k] for k in Keep]
+                        Chans=[Chans[k] for k in Keep]
+
+            # Everything new is converted to pixels in one pass and added to the trace as a
+            # batch. In continuous sweeps the readings past the end of the trace are kept to
+            # start the next one with. Otherwise they are dropped, and the next trace starts
+            # from its trigger.
+            if Times and FirstPoint_A:
+                TraceStartTime=min(Times) # Time stamp of first pixel of trace (x = 0)
+                FirstPoint_A=False
+            Drawn=0
+            if Times:
+                LastLine=False
+                Split=Split_Channels(Times,Volts,Chans)
+                Chan_Used={}
+                for Chan in Split:
+                    Chan_Volts=Split[Chan][1]
+                    if Scope_Average is not None:
+                        Chan_Volts=Scope_Average.Add(Chan,Split[Chan][0],Chan_Volts,TraceStartTime)
+                    Chan_Last,Used=self.TraceGraph.Add_Readings(Chan,Split[Chan][0],Chan_Volts)
+                    Chan_Used[Chan]=Used
+                    Drawn += Used
+                    LastLine=LastLine or Chan_Last
+                LinePtr += Drawn # Count the readings in this trace
+                # If this is the last line for this sweep, set up for new sweep
+                if LastLine:
+                    # Diagnostic print showing how many readings in this trace.
+                    # Comment out when not needed.
+                    #print("Last line LinePtr =",LinePtr)
+                    StartNewTrace=True
+                    SingleSweepA=False # This is the end of a single sweep
+                    if ContinuousSweepA:
+                        Carry_Times=[]
+                        Carry_Volts=[]
+                        Carry_Chans=[]
+                        for Chan in Split:
+                            Rest=len(Split[Chan][0])-Chan_Used[Chan]
+                            if Rest > 0:
+                                Carry_Times.extend(Split[Chan][0][Chan_Used[Chan]:])
+                                Carry_Volts.extend(Split[Chan][1][Chan_Used[Chan]:])
+                                Carry_Chans.extend([Chan]*Rest)
+                        if Carry_Times:
+                            self.Carry=(Carry_Times,Carry_Volts,Carry_Chans)
+                            Taken -= len(Carry_Times) # Counted when they are drawn or dropped
+            Scope_Stats.Readings(Taken,Drawn)
+            self.TraceGraph.Show_Trace() # Put everything new on the screen at once
         else:
+            self.Drop_Carry()
+            Scope_Stats.Readings(len(Times),0) # Nothing is being drawn
             if FaultCode == 0 and not self.StatusMsg_Clear_Tmr_Run:
                 MsgCode = 2
+        Scope_History.Add(*Batch)
 
+    # Readings carried over for the next sweep are thrown away if there isn't going to be one
+    # to start with them
+    def Drop_Carry(self):
+        if self.Carry is not None:
+            Scope_Stats.Readings(len(self.Carry[0]),0)
+            self.Carry=None
 
-        # Status message clear timer
-        if self.StatusMsg_Clear_Tmr_Run and (time.time() >= self.StatusMsg_Clear_Tmr_Complete):
-            self.StatusMsg_Clear_Tmr_Run = False
-            MsgCode=0
-            
-# Continuously run "Update_All", but take a 1 millisecond breath between runs.
-        self._timer = self.after(1,self.Update_All)
-
-        
     # This is used to run the Rpi.GPIO cleanup() method to return pins to be an input
     # and then destroy the app and its parent.
     def onClose(self):
 # !!!!!!!!!!!!!!!!MAKE SURE TO UNCOMMENT GPIO.cleanup WHEN GPIO IS USED IN THE CODE!!!!!!!!!!!!!!!!!!
 #        GPIO.cleanup()
+        try:
+            self.tk.deletefilehandler(Wake_Read_A)
+        except (AttributeError,TclError):
+            pass
+        if Scope_Recorder is not None: # Write out the last of the recording
+            self.RecGraph.Rec_On.set(0)
+            self.RecGraph.Rec_Mod()
+        if Stats_File:
+            Stats_Dump(Stats_File)
+        if Profile_Dir:
+            Profile_Save(self.Profiler,"gui")
         self.destroy()
         self.parent.destroy()
         
 ########################### RUN IT ##############################
 if __name__ == '__main__':
 
-    # Start up the concurrent A/D reader task
-    p1 = Process(target=ADC_Reader_A,name='ADC_Reader_A',args=(ADchannel_A,ADvalue_A,ReadTime_A,AD_Bits_A,
-                                                               AD_Adrs1_A,AD_Adrs2_A,AD_Set_A,
-                                                               ScopePower,AD_Error_A))
+    # Start up the concurrent A/D reader tasks, one for each converter chip
+    Reader=Profiled_Reader if Profile_Dir else ADC_Reader_A
+    p1 = Process(target=Reader,name='ADC_Reader_A',args=(1,Scope_Ctl_A,Scope_Ctl_Cond,Sample_Rings[0],
+                                                         Wake_Write_A))
+    p2 = Process(target=Reader,name='ADC_Reader_A2',args=(2,Scope_Ctl_A,Scope_Ctl_Cond,Sample_Rings[1],
+                                                          Wake_Write_A))
     p1.daemon=True # Setting the daemon True should prevent orphan process when parent exits
+    p2.daemon=True
     p1.start()
+    p2.start()
 
     # Set up and display main GUI window
     root = Tk()
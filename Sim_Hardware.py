@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+
+# ===============================================
+# Simulated hardware for S_Scope_ABE.py
+#
+# Stands in for the Raspberry Pi GPIO library and the AB Electronics ADC Pi Plus board, so the
+# scope can be run, and its acquisition and drawing timed, on a machine that has neither.
+# S_Scope_ABE.py uses this module in place of the real ones when it is started with --sim, or
+# with SCOPE_SIM=1 in the environment.
+#
+# The two MCP3424 converter chips on the board are emulated at the i2c level: config byte
+# written, data and config bytes read back, RDY bit and all. Conversions take as long as they do
+# on the real chip (240, 60, 15 or 3.75 samples per second for 12, 14, 16 or 18 bits) and every
+# i2c transfer takes the time it would on a 100 kHz bus. So the ABE style ADCPi below, the SMBus
+# it talks through and the /dev/i2c style device used for streaming all behave, and are paced,
+# the way the hardware is.
+# ================================================
+
+# The signal on each A/D channel can be set with SCOPE_SIM_WAVES, a comma separated list of
+#   channel=shape:frequency:amplitude:offset
+# for example SCOPE_SIM_WAVES="1=sine:2:2:2.5,3=noise::0.2:1". Shape is sine, square, noise or
+# burst, frequency is in Hz and amplitude and offset are in volts at the board input (0-5V).
+# Any part left empty keeps its default. A burst is a 20 times faster sine that is only on for
+# the first quarter of each cycle.
+#
+# The trigger pins read as a square wave of SCOPE_SIM_TRIG Hz (0.5 by default), each pin a little
+# later than the one before. Edge detection on them calls back at each edge, as RPi.GPIO does.
+
+import os
+import time
+import math
+import random
+import threading
+
+# ---------------- Signals ----------------
+
+Sim_Waves={1:["sine",1.0,2.0,2.5],
+           2:["square",2.0,2.0,2.5],
+           3:["noise",0.0,0.5,2.5],
+           4:["burst",1.0,2.0,2.5],
+           5:["sine",5.0,1.0,1.5],
+           6:["square",0.5,1.5,3.0],
+           7:["noise",0.0,0.1,4.0],
+           8:["burst",0.25,2.5,2.5]}
+
+for Wave_Spec in os.environ.get("SCOPE_SIM_WAVES","").split(","):
+    if "=" not in Wave_Spec:
+        continue
+    Chan,Parts=Wave_Spec.split("=",1)
+    Wave=Sim_Waves[int(Chan)]
+    for i,Part in enumerate(Parts.split(":")[:4]):
+        if Part:
+            Wave[i]=Part if i == 0 else float(Part)
+
+# Volts at the board input on channel Chan (1-8) at time T
+def Sim_Volts(Chan,T):
+    Shape,Freq,Amp,Offset=Sim_Waves[Chan]
+    if Shape == "sine":
+        return Offset+Amp*math.sin(2*math.pi*Freq*T)
+    if Shape == "square":
+        return Offset+(Amp if (T*Freq) % 1.0 < 0.5 else -Amp)
+    if Shape == "noise":
+        return Offset+random.gauss(0.0,Amp)
+    if Shape == "burst":
+        if (T*Freq) % 1.0 < 0.25:
+            return Offset+Amp*math.sin(2*math.pi*20*Freq*T)
+        return Offset
+    return Offset
+
+# ---------------- MCP3424 converter chip ----------------
+
+I2C_Byte_Time=9/100000.0 # One byte, with its ack, on a 100 kHz i2c bus
+Sim_SPS={0:240.0,1:60.0,2:15.0,3:3.75} # Conversions per second for the rate bits of the config
+Sim_Divider=2.471 # The ADC Pi input voltage divider
+
+class Sim_MCP3424:
+    def __init__(self,First_Chan):
+        self.First_Chan=First_Chan # Board channel wired to the chip's channel 1
+        self.Config=0x90 # Power up default. Continuous, channel 1, 12 bits, gain 1
+        self.Start=time.time() # When the current run of conversions started
+        self.Taken=0 # Conversions already read
+        self.Code=0
+
+    # Rate bits, conversions per second and data bits the chip is set for
+    def Rate(self):
+        Rate_Bits=(self.Config >> 2) & 3
+        return Rate_Bits,Sim_SPS[Rate_Bits],12+2*Rate_Bits
+
+    def Write(self,Config):
+        time.sleep(2*I2C_Byte_Time)
+        Old=self.Config
+        self.Config=Config & 0x7F
+        # Writing the config byte in one shot mode with RDY set starts a conversion. In
+        # continuous mode a change of setting starts a new run of conversions. The same setting
+        # written again, as the command byte of every smbus block read is, leaves the run going.
+        # If it restarted the conversion the ABE library's RDY polling would never see a result.
+        if (Config & 0x10) == 0 and (Config & 0x80):
+            self.Start=time.time()
+            self.Taken=0
+        elif (Config & 0x10) and (Config & 0x7F) != (Old & 0x7F):
+            self.Start=time.time()
+            self.Taken=0
+
+    # Read Count bytes. The data bytes, then the config byte with RDY clear if the result is new
+    def Read(self,Count):
+        time.sleep((Count+1)*I2C_Byte_Time)
+        Rate_Bits,SPS,Bits=self.Rate()
+        Done=int((time.time()-self.Start)*SPS) # Conversions finished since the run started
+        if (self.Config & 0x10) == 0:
+            Done=min(Done,1) # One shot mode only does the one
+        Ready=Done > self.Taken
+        if Ready:
+            self.Taken=Done
+            Chan=self.First_Chan+((self.Config >> 5) & 3)
+            Volts=Sim_Volts(Chan,self.Start+Done/SPS)/Sim_Divider
+            Code=int(round(Volts*(1 << (Bits-1))/2.048))
+            Limit=(1 << (Bits-1))-1
+            self.Code=max(-Limit-1,min(Limit,Code)) & ((1 << Bits)-1)
+        Data=[(self.Code >> 16) & 0xFF,(self.Code >> 8) & 0xFF,self.Code & 0xFF] if Bits == 18 else \
+             [(self.Code >> 8) & 0xFF,self.Code & 0xFF]
+        Data.append(self.Config | (0 if Ready else 0x80))
+        Data=Data+[Data[-1]]*Count # The real chip repeats the config byte for as long as it is read
+        return Data[:Count]
+
+# The chips on this process's simulated bus, by address. The ADC Pi can be jumpered to any of the
+# MCP3424 addresses 0x68-0x6F. Channels 1-4 are on the even address, 5-8 on the odd one.
+Sim_Chips={}
+
+def Sim_Chip(Address):
+    if Address < 0x68 or Address > 0x6F:
+        raise IOError("No device at i2c address %d" % Address)
+    if Address not in Sim_Chips:
+        Sim_Chips[Address]=Sim_MCP3424(1 if Address % 2 == 0 else 5)
+    return Sim_Chips[Address]
+
+# ---------------- i2c bus ----------------
+
+# The parts of python smbus's SMBus that the ABE library uses
+class SMBus:
+    def write_byte(self,Address,Value):
+        Sim_Chip(Address).Write(Value)
+
+    # Like real smbus, Cmd is written to the chip first, and the MCP3424 takes it as its config
+    def read_i2c_block_data(self,Address,Cmd,Length=32):
+        Chip=Sim_Chip(Address)
+        Chip.Write(Cmd)
+        return Chip.Read(Length)
+
+class ABEHelpers:
+    def get_smbus(self):
+        return SMBus()
+
+# The /dev/i2c-N device as S_Scope_ABE.py's MCP3424_Stream uses it
+class Sim_I2C_Dev:
+    def __init__(self):
+        self.Address=None
+
+    def Select(self,Address):
+        self.Address=Address
+
+    def Write(self,Data):
+        for Value in Data:
+            Sim_Chip(self.Address).Write(Value)
+
+    def Read(self,Count):
+        return bytes(Sim_Chip(self.Address).Read(Count))
+
+    def Close(self):
+        pass
+
+# ---------------- ADC Pi board ----------------
+
+# The parts of the AB Electronics ADCPi class that S_Scope_ABE.py uses, done the same way: the
+# config byte is written when the channel or mode changes (every read in one shot mode) and the
+# chip is polled until RDY drops. Like the ABE library, read_raw returns a negative count with
+# its sign bit cleared.
+class ADCPi:
+    def __init__(self,bus,address=0x68,address2=0x69,rate=18):
+        self.bus=bus
+        self.address=address
+        self.address2=address2
+        self.rate_bits={12:0,14:1,16:2,18:3}.get(rate,3)
+        self.bits=12+2*self.rate_bits
+        self.conversion_mode=1
+        self.__signbit=False
+        self.config={}
+        for Adrs in (address,address2):
+            self.set_config(Adrs,0)
+
+    def set_config(self,Adrs,Chan_Bits):
+        Config=(self.conversion_mode << 4) | (Chan_Bits << 5) | (self.rate_bits << 2)
+        if self.config.get(Adrs) != Config or not self.conversion_mode:
+            self.bus.write_byte(Adrs,Config | (0 if self.conversion_mode else 0x80))
+            self.config[Adrs]=Config
+
+    def read_raw(self,channel):
+        Adrs=self.address if channel < 5 else self.address2
+        self.set_config(Adrs,(channel-1) & 3)
+        Count=4 if self.bits == 18 else 3
+        while True:
+            Data=self.bus.read_i2c_block_data(Adrs,self.config[Adrs],Count)
+            if not (Data[Count-1] & 0x80):
+                break
+        Code=0
+        for Byte in Data[:Count-1]:
+            Code=(Code << 8) | Byte
+        Code &= (1 << self.bits)-1
+        # Like the ABE library, a negative count comes back with its sign bit cleared, and the
+        # sign is only kept in __signbit
+        self.__signbit=bool(Code & (1 << (self.bits-1)))
+        if self.__signbit:
+            Code &= ~(1 << (self.bits-1))
+        return Code
+
+    def read_voltage(self,channel):
+        Code=self.read_raw(channel)
+        if self.__signbit: # Like the ABE library, negative readings come back as 0V
+            return 0.0
+        return Code*(2.048/(1 << (self.bits-1)))*Sim_Divider
+
+    def set_bit_rate(self,rate):
+        self.rate_bits={12:0,14:1,16:2,18:3}.get(rate,3)
+        self.bits=12+2*self.rate_bits
+        self.config={}
+
+    def set_conversion_mode(self,mode):
+        self.conversion_mode=1 if mode else 0
+        self.config={}
+
+    def set_pga(self,gain):
+        pass
+
+# ---------------- GPIO ----------------
+
+# Stands in for RPi.GPIO. Inputs read as a square wave, see SCOPE_SIM_TRIG above. An edge
+# detect runs a thread per pin that sleeps until the pin's next edge and calls the callback.
+class Sim_GPIO:
+    BCM=11
+    BOARD=10
+    IN=1
+    OUT=0
+    PUD_UP=22
+    PUD_DOWN=21
+    PUD_OFF=20
+    HIGH=1
+    LOW=0
+    RISING=31
+    FALLING=32
+    BOTH=33
+
+    def __init__(self):
+        self.Mode=None
+        self.Pins={} # Direction of each pin set up
+        self.Outputs={} # Level last written to each output pin
+        self.Trig_Hz=float(os.environ.get("SCOPE_SIM_TRIG","0.5"))
+        self.Detects={} # Stop event of each pin's edge detect thread
+
+    def setmode(self,Mode):
+        self.Mode=Mode
+
+    def setwarnings(self,Flag):
+        pass
+
+    def setup(self,Pin,Direction,pull_up_down=None,initial=None):
+        self.Pins[Pin]=Direction
+        if Direction == self.OUT:
+            self.Outputs[Pin]=initial or 0
+
+    def output(self,Pin,Level):
+        self.Outputs[Pin]=1 if Level else 0
+
+    def input(self,Pin):
+        if self.Pins.get(Pin) == self.OUT:
+            return self.Outputs.get(Pin,0)
+        return 1 if (time.time()*self.Trig_Hz+Pin/40.0) % 1.0 < 0.5 else 0
+
+    def add_event_detect(self,Pin,Edge,callback=None,bouncetime=None):
+        if self.Pins.get(Pin) != self.IN:
+            raise RuntimeError("You must setup() the GPIO channel as an input first")
+        if Pin in self.Detects:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        Stop=threading.Event()
+        self.Detects[Pin]=Stop
+        threading.Thread(target=self.Edge_Watch,args=(Pin,Edge,callback,Stop),daemon=True).start()
+
+    def remove_event_detect(self,Pin):
+        if Pin in self.Detects:
+            self.Detects.pop(Pin).set()
+
+    # The pin is high for the first half of each cycle of its square wave
+    def Edge_Watch(self,Pin,Edge,Callback,Stop):
+        Phases=[]
+        if Edge in (self.RISING,self.BOTH):
+            Phases.append(0.0)
+        if Edge in (self.FALLING,self.BOTH):
+            Phases.append(0.5)
+        while not Stop.is_set():
+            Phase=time.time()*self.Trig_Hz+Pin/40.0
+            Cycle=math.floor(Phase)
+            Next=min(Cycle+Edge_Phase+(1 if Cycle+Edge_Phase <= Phase else 0) for Edge_Phase in Phases)
+            if Stop.wait((Next-Phase)/self.Trig_Hz):
+                break
+            if Callback is not None:
+                Callback(Pin)
+
+    def cleanup(self):
+        for Pin in list(self.Detects):
+            self.remove_event_detect(Pin)
+        self.Pins={}
+        self.Outputs={}
+
+GPIO=Sim_GPIO()